@@ -0,0 +1,226 @@
+"""
+Offline re-audit of recorded footage with the live detector (same filters, same stats).
+
+    python analyze_video.py recordings/ --out audit/ --model best.pt --workers 16
+
+Every video is split into segments of --segment frames that are processed by a pool of
+worker processes (one PPE_Detector each, batched headless inference, no drawing/encoding).
+Each segment is written to <out>/<video>/seg_00000.npz as soon as it is done, so an interrupted
+run picks up where it stopped. Once all segments of a video exist they are concatenated
+into <out>/<video>.npz (<video> = its path below the input folder, e.g. cam1/shift) with these columns:
+
+    frames:      frame, total_people, violations      (one row per analyzed frame)
+    detections:  det_frame, cls, conf, x1, y1, x2, y2 (one row per detection)
+    label_ids / label_names: class ID -> label
+
+    data = np.load('audit/shift_a.npz'); data['violations'].max()
+"""
+import argparse
+import hashlib
+import os
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.mpg', '.mpeg', '.ts')
+FRAME_COLUMNS = ('frame', 'total_people', 'violations')
+DETECTION_COLUMNS = ('det_frame', 'cls', 'conf', 'x1', 'y1', 'x2', 'y2')
+
+def find_videos(paths):
+    """
+    {video path: output name}. The name is the path relative to the input folder without the
+    extension (cam1/shift), so equal file names in different subfolders don't share their output.
+    """
+    videos = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for f in files:
+                    if f.lower().endswith(VIDEO_EXTENSIONS):
+                        video_path = os.path.join(root, f)
+                        videos[video_path] = os.path.splitext(os.path.relpath(video_path, path))[0]
+        else:
+            videos[path] = os.path.splitext(os.path.basename(path))[0]
+    # Same name from different inputs (a/shift.mp4 b/shift.mp4): tell them apart by a hash of the path
+    counts = {}
+    for name in videos.values():
+        counts[name] = counts.get(name, 0) + 1
+    for video_path, name in videos.items():
+        if counts[name] > 1:
+            digest = hashlib.sha1(os.path.abspath(video_path).encode('utf-8')).hexdigest()[:8]
+            videos[video_path] = f"{name}_{digest}"
+    return dict(sorted(videos.items()))
+
+def frame_count(path):
+    video = cv2.VideoCapture(path)
+    count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    video.release()
+    return count
+
+def segment_path(out_dir, name, index):
+    return os.path.join(out_dir, name, f"seg_{index:05d}.npz")
+
+def save_npz(path, **columns):
+    """Write atomically (temp file + rename): a killed run never leaves a half-written segment behind."""
+    tmp = path + '.tmp.npz'
+    np.savez_compressed(tmp, **columns)
+    os.replace(tmp, path)
+
+# --- Worker process ---
+
+detector = None
+worker_args = None
+worker_error = None
+
+def init_worker(args):
+    """Pool initializer: one detector per process, loaded once and reused for all its segments."""
+    global detector, worker_args, worker_error
+    # One CPU thread per process for OpenCV / the runtime, the pool provides the parallelism
+    cv2.setNumThreads(1)
+    from detector import PPE_Detector
+    worker_args = args
+    detector = PPE_Detector(args.model, tracking=False, backend=args.backend, imgsz=args.imgsz,
+                            int8=args.int8, threads=args.threads)
+    # Safe Mode finds nothing and the COCO fallback's class IDs aren't PPE classes: their segments
+    # would be kept as done by every later run. Raised from analyze_segment, an exception in the
+    # initializer would only make the pool restart the worker forever
+    if detector.model is None or detector.fallback:
+        worker_error = f"PPE model {args.model} ({args.backend}) could not be loaded, nothing was analyzed"
+
+def analyze_segment(task):
+    """Run the detector on frames [start, stop) of a video and save the segment. Returns (task, frames analyzed)."""
+    if worker_error:
+        raise RuntimeError(worker_error)
+    video_path, name, index, start, stop = task
+    args = worker_args
+    frames_rows, det_rows, labels = [], [], {}
+
+    video = cv2.VideoCapture(video_path)
+    video.set(cv2.CAP_PROP_POS_FRAMES, start)
+    batch, batch_ids = [], []
+    position = start
+
+    def flush():
+        for frame_id, (detections, stats) in zip(batch_ids, detector.detect_batch(batch, headless=True)):
+            frames_rows.append((frame_id, stats["total_people"], stats["violations"]))
+            for det in detections:
+                x1, y1, x2, y2 = det['box']
+                det_rows.append((frame_id, det['id'], det['conf'], x1, y1, x2, y2))
+                labels[det['id']] = det['label']
+        batch.clear()
+        batch_ids.clear()
+
+    while position < stop:
+        # grab() skips decoding the frames that --stride leaves out
+        if (position - start) % args.stride:
+            ok = video.grab()
+        else:
+            ok, frame = video.read()
+            if ok:
+                batch.append(frame)
+                batch_ids.append(position)
+                if len(batch) >= args.batch:
+                    flush()
+        if not ok:
+            break
+        position += 1
+    if batch:
+        flush()
+    video.release()
+
+    frames = np.array(frames_rows, dtype=np.int64).reshape(-1, len(FRAME_COLUMNS))
+    dets = np.array(det_rows, dtype=np.float64).reshape(-1, len(DETECTION_COLUMNS))
+    save_npz(segment_path(args.out, name, index),
+             frame=frames[:, 0].astype(np.int32),
+             total_people=frames[:, 1].astype(np.int16),
+             violations=frames[:, 2].astype(np.int16),
+             det_frame=dets[:, 0].astype(np.int32),
+             cls=dets[:, 1].astype(np.int16),
+             conf=dets[:, 2].astype(np.float32),
+             x1=dets[:, 3].astype(np.int16), y1=dets[:, 4].astype(np.int16),
+             x2=dets[:, 5].astype(np.int16), y2=dets[:, 6].astype(np.int16),
+             label_ids=np.array(list(labels.keys()), dtype=np.int16),
+             label_names=np.array(list(labels.values()), dtype=str))
+    return task, len(frames_rows)
+
+# --- Driver ---
+
+def merge_segments(out_dir, name, num_segments):
+    """Concatenate the segments of a video into <out>/<name>.npz."""
+    parts = [np.load(segment_path(out_dir, name, i)) for i in range(num_segments)]
+    labels = {}
+    for part in parts:
+        labels.update(zip(part['label_ids'].tolist(), part['label_names'].tolist()))
+    columns = {name: np.concatenate([part[name] for part in parts])
+               for name in FRAME_COLUMNS + DETECTION_COLUMNS}
+    save_npz(os.path.join(out_dir, name + '.npz'),
+             label_ids=np.array(list(labels.keys()), dtype=np.int16),
+             label_names=np.array(list(labels.values()), dtype=str), **columns)
+
+def plan(args, videos):
+    """Segments still to do, and segment counts per video. Videos with a merged file are skipped."""
+    tasks, segments = [], {}
+    for video_path, name in videos.items():
+        if os.path.exists(os.path.join(args.out, name + '.npz')):
+            print(f"[Skip] {video_path} (already analyzed)")
+            continue
+        total = frame_count(video_path)
+        if total <= 0:
+            print(f"[Skip] {video_path} (can't read frame count)")
+            continue
+        os.makedirs(os.path.join(args.out, name), exist_ok=True)
+        starts = range(0, total, args.segment)
+        segments[video_path] = len(starts)
+        for index, start in enumerate(starts):
+            if not os.path.exists(segment_path(args.out, name, index)):
+                tasks.append((video_path, name, index, start, min(start + args.segment, total)))
+    return tasks, segments
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch PPE analysis of recorded video files.")
+    parser.add_argument('inputs', nargs='+', help="video files or directories")
+    parser.add_argument('--out', default='analysis', help="output directory")
+    parser.add_argument('--model', default='best.pt')
+    parser.add_argument('--backend', default='torch', choices=('torch', 'onnx', 'openvino'))
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--threads', type=int, default=1, help="inference threads per worker")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--segment', type=int, default=3000, help="frames per segment (unit of work)")
+    parser.add_argument('--batch', type=int, default=8, help="frames per model call")
+    parser.add_argument('--stride', type=int, default=1, help="analyze every Nth frame")
+    args = parser.parse_args()
+    os.makedirs(args.out, exist_ok=True)
+
+    videos = find_videos(args.inputs)
+    tasks, segments = plan(args, videos)
+    remaining = {video_path: 0 for video_path in segments}
+    for video_path, _, _, _, _ in tasks:
+        remaining[video_path] += 1
+    print(f"{len(videos)} video(s), {len(tasks)} segment(s) to analyze with {args.workers} worker(s)")
+
+    start = time.time()
+    analyzed = 0
+    if tasks:
+        with Pool(args.workers, initializer=init_worker, initargs=(args,)) as pool:
+            for done, ((video_path, name, index, _, _), frames) in enumerate(
+                    pool.imap_unordered(analyze_segment, tasks), 1):
+                analyzed += frames
+                elapsed = time.time() - start
+                print(f"[{done}/{len(tasks)}] {name} segment {index}: "
+                      f"{frames} frames, {analyzed / elapsed:.1f} frames/s overall")
+                remaining[video_path] -= 1
+                if remaining[video_path] == 0:
+                    merge_segments(args.out, name, segments[video_path])
+    # Videos whose segments were all done by an earlier, interrupted run
+    for video_path, count in remaining.items():
+        if count == 0 and not os.path.exists(os.path.join(args.out, videos[video_path] + '.npz')):
+            merge_segments(args.out, videos[video_path], segments[video_path])
+
+    elapsed = time.time() - start
+    print(f"Done: {analyzed} frames in {elapsed:.1f}s ({analyzed / max(elapsed, 1e-9):.1f} frames/s)")
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
 from flask import Flask, render_template, Response, jsonify
-from camera import VideoCamera
+from camera import CameraManager
 from detector import PPE_Detector
+from motion import MotionGate
+from zones import Zones
+from broadcaster import FrameBroadcaster
+from metrics import metrics
 import cv2
+import json
 import threading
 import time
 
@@ -9,100 +14,379 @@ app = Flask(__name__, template_folder='../templates', static_folder='../static')
 from flask_cors import CORS
 CORS(app)
 
-# Global variables to hold latest stats
-current_stats = {
-    "total_people": 0,
-    "violations": 0
-}
-
-# Initialize Camera and Detector
+# Initialize Cameras and Detector
 # NOTE: Replace '0' with your ESP32 stream URL, e.g., 'http://192.168.1.X:81/stream'
-camera_source = 0 
-camera = VideoCamera(source=camera_source)
-detector = PPE_Detector()
-
-def gen_frames():
-    """Generator function for video streaming."""
-    global current_stats
-    print("Starting video stream loop...")
-    frame_count = 0
-    while True:
-        try:
-            frame = camera.get_frame()
-            if frame is None:
-                print("Error: Camera returned None frame.")
+# More cameras can be added at runtime with POST /api/cameras
+DEFAULT_CAMERA_ID = "cam0"
+camera_source = 0
+# threaded=True: a reader thread drains each stream so we always process the newest frame
+# lazy=True: cameras connect in that thread, so the server starts without waiting for them
+# JPEG_QUALITY / JPEG_SCALE: stream quality vs encode time and bandwidth (1.0 = full resolution)
+JPEG_QUALITY = 80
+JPEG_SCALE = 1.0
+ENCODE_WORKERS = 2
+# Max stats pushes per second on /api/stream (changes in between are coalesced)
+STATS_MAX_RATE = 5.0
+# The default camera is registered by start_background_init(), importing this module opens nothing
+cameras = CameraManager(threaded=True, lazy=True, jpeg_quality=JPEG_QUALITY, jpeg_scale=JPEG_SCALE)
+# Time we can spend per frame. If YOLO is slower than this (CPU-only boxes) the model
+# only runs every Nth frame and the boxes are carried forward in between. None = every frame.
+LATENCY_BUDGET = 1 / 30
+# Skip YOLO while a camera shows a static scene (empty aisle); re-check at least every 5s anyway
+motion_gate = MotionGate(refresh_interval=5.0)
+# Inference backend: 'torch' (best.pt), or 'onnx' / 'openvino' for faster CPU-only boxes
+# (exported next to best.pt on first start, MODEL_INT8 = quantized export).
+# MODEL_IMGSZ: model input size, MODEL_THREADS: CPU threads for inference (None = all cores)
+MODEL_BACKEND = 'torch'
+MODEL_IMGSZ = 640
+MODEL_INT8 = False
+MODEL_THREADS = None
+# lazy=True: the model loads in the background (start_background_init), see /readyz
+detector = PPE_Detector(latency_budget=LATENCY_BUDGET, motion_gate=motion_gate,
+                        backend=MODEL_BACKEND, imgsz=MODEL_IMGSZ, int8=MODEL_INT8, threads=MODEL_THREADS,
+                        lazy=True)
+
+class StatsPublisher:
+    """
+    Pushes the total stats (FrameBroadcaster.current_stats) to /api/stream (Server-Sent Events) clients only when it changes,
+    coalesced to at most max_rate messages per second. The JSON is built once per change
+    and the same bytes go to every dashboard.
+    """
+    def __init__(self, max_rate=5.0, keepalive=15.0):
+        self.min_interval = 1.0 / max_rate
+        self.keepalive = keepalive
+        self.condition = threading.Condition()
+        self.stats = None      # last published stats
+        self.pending = None    # newer stats held back by the rate limit
+        self.message = None    # SSE-encoded last published stats
+        self.version = 0
+        self.last_emit = 0.0
+        self.timer = None
+        self.listeners = []    # callables() run after every push (e.g. the asyncio server)
+
+    def update(self, stats):
+        """Called by the pipeline after every batch. Cheap if nothing changed."""
+        emitted = False
+        with self.condition:
+            latest = self.pending if self.pending is not None else self.stats
+            if stats == latest:
+                return
+            self.pending = dict(stats)
+            wait = self.last_emit + self.min_interval - time.time()
+            if wait <= 0:
+                emitted = self._emit()
+            elif self.timer is None:
+                # Flush whatever is pending once the rate limit allows it
+                self.timer = threading.Timer(wait, self._flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if emitted:
+            self._notify()
+
+    def _flush(self):
+        with self.condition:
+            self.timer = None
+            emitted = self._emit()
+        if emitted:
+            self._notify()
+
+    def _emit(self):
+        # Caller holds self.condition
+        stats, self.pending = self.pending, None
+        if stats is None or stats == self.stats:
+            return False
+        self.stats = stats
+        self.version += 1
+        self.last_emit = time.time()
+        self.message = f"id: {self.version}\nevent: stats\ndata: {json.dumps(stats)}\n\n".encode()
+        metrics.incr('stats_pushes')
+        self.condition.notify_all()
+        return True
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+    def latest_message(self):
+        """(version, SSE bytes) of the last pushed stats, (0, None) before the first push."""
+        with self.condition:
+            return self.version, self.message
+
+    def events(self):
+        """Generator for one SSE client: current stats right away, then every change."""
+        last_version = 0
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.version != last_version, timeout=self.keepalive)
+                version, message = self.version, self.message
+            if version == last_version:
+                yield b": keepalive\n\n" # Keeps proxies from closing an idle stream
                 continue
+            last_version = version
+            yield message
 
-            # Run Detection
-            annotated_frame, stats = detector.detect(frame)
-            
-            # Update global stats
-            current_stats = stats
-            
-            # Encode to JPEG
-            frame_bytes = camera.get_jpg_bytes(annotated_frame)
-            
-            # Yield frame in MJPEG format
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                   
-            frame_count += 1
-            if frame_count % 30 == 0:
-                print(f"Stream is alive! Processed {frame_count} frames.")
-                
-        except Exception as e:
-            print(f"CRITICAL ERROR in gen_frames: {e}")
-            time.sleep(1) # Prevent spamming loop on error
+stats_publisher = StatsPublisher(max_rate=STATS_MAX_RATE)
+
+broadcaster = FrameBroadcaster(cameras, detector, encode_workers=ENCODE_WORKERS, stats_publisher=stats_publisher)
+# Latest stats per camera (filled by the broadcaster's pipeline thread)
+camera_stats = broadcaster.camera_stats
+
+init_lock = threading.Lock()
+init_started = False
+
+def start_background_init():
+    """
+    Load the model and start the pipeline without blocking the web server:
+    it answers right away and reports "warming up" (/readyz, /api/status) until everything is ready.
+    Only the first call does anything. Called by both entry points (python app.py, async_app.py) and,
+    for `flask run` / WSGI servers that never run __main__, on the first request.
+    """
+    global init_started
+    with init_lock:
+        if init_started:
+            return
+        init_started = True
+    if cameras.get(DEFAULT_CAMERA_ID) is None:
+        cameras.add(DEFAULT_CAMERA_ID, camera_source)
+    if not detector.loaded:
+        threading.Thread(target=detector.load, name='model-loader', daemon=True).start()
+    # Keep detection (and /api/status) running even before the first viewer connects
+    broadcaster.start()
+
+def readiness():
+    """(ready, details): ready once the model is loaded and every camera tried to connect once."""
+    cams = {cam_id: "connecting" if cam.initializing else "ready" for cam_id, cam in cameras.items()}
+    ready = detector.loaded and all(state == "ready" for state in cams.values())
+    return ready, {
+        "status": "ready" if ready else "warming up",
+        "model": "ready" if detector.loaded else "loading",
+        "cameras": cams
+    }
+
+def gen_frames(cam_id=DEFAULT_CAMERA_ID):
+    """Generator function for video streaming (one per viewer, shares the broadcaster)."""
+    return broadcaster.frames(cam_id)
+
+def camera_status(cam_id, cam):
+    return {
+        "id": cam_id,
+        "source": cam.source,
+        "is_running": cam.is_running,
+        "connecting": cam.initializing,
+        "connection": cam.connection_status(),
+        "frame_seq": cam.frame_seq,
+        "frames_dropped": cam.frames_dropped,
+        "viewers": broadcaster.viewers.get(cam_id, 0),
+        "stats": camera_stats.get(cam_id, {"total_people": 0, "violations": 0})
+    }
+
+def parse_source(new_source):
+    # Simple validation: if it looks like an int, cast it
+    if str(new_source).isdigit():
+        new_source = int(new_source)
+    return new_source
+
+# --- API actions ---
+# Plain functions returning (payload, http_status), shared by the Flask routes below
+# and the asyncio server (async_app.py).
+
+def camera_not_found(cam_id):
+    return {"message": f"Unknown camera '{cam_id}'", "success": False}, 404
+
+def list_cameras_action():
+    return [camera_status(cam_id, cam) for cam_id, cam in cameras.items()], 200
+
+def add_camera_action(data):
+    cam_id = data.get("id")
+    if not cam_id:
+        return {"message": "Missing camera id", "success": False}, 400
+
+    new_source = parse_source(data.get("source", 0))
+    cameras.add(cam_id, new_source)
+    detector.reset_stream(cam_id)
+    return {"message": f"Camera '{cam_id}' set to {new_source}", "success": True}, 200
+
+def remove_camera_action(cam_id):
+    if not cameras.remove(cam_id):
+        return camera_not_found(cam_id)
+    detector.reset_stream(cam_id)
+    return {"message": f"Camera '{cam_id}' removed", "success": True}, 200
+
+def camera_status_action(cam_id):
+    cam = cameras.get(cam_id)
+    if cam is None:
+        return camera_not_found(cam_id)
+    return camera_status(cam_id, cam), 200
+
+def camera_config_action(cam_id, data):
+    cam = cameras.get(cam_id)
+    if cam is None:
+        return camera_not_found(cam_id)
+
+    new_source = parse_source(data.get("source", 0))
+    # Returns right away: the current source keeps streaming until the new one delivers
+    # its first frame (see "connection" in the camera status)
+    cam.set_source(new_source)
+    return {"message": f"Camera switching to {new_source}", "success": True}, 200
+
+def camera_toggle_action(cam_id, data):
+    cam = cameras.get(cam_id)
+    if cam is None:
+        return camera_not_found(cam_id)
+
+    action = data.get("action", "start") # "start" or "stop"
+    if action == "stop":
+        cam.stop()
+        return {"message": "Camera stopped", "is_running": False}, 200
+    else:
+        cam.start()
+        return {"message": "Camera started", "is_running": True}, 200
+
+def status_action():
+    if not detector.loaded:
+        return dict(broadcaster.current_stats, status="warming up"), 200
+    return broadcaster.current_stats, 200
+
+def healthz_action():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}, 200
+
+def readyz_action():
+    """Readiness: 503 until the model is loaded and the cameras were opened once."""
+    ready, details = readiness()
+    return details, 200 if ready else 503
+
+def camera_zones_action(cam_id, data=None):
+    """
+    GET (data=None): current zones of a camera. POST: set them, e.g.
+    {"polygons": [[[0.1, 0.3], [0.9, 0.3], [0.9, 1.0], [0.1, 1.0]]], "tile_size": 640, "overlap": 0.2}
+    (polygon points are fractions of the frame width/height; {} = whole frame again).
+    """
+    if cameras.get(cam_id) is None:
+        return camera_not_found(cam_id)
+    if data is not None:
+        if not isinstance(data, dict):
+            return {"message": "Invalid zones: expected a JSON object", "success": False}, 400
+        try:
+            zones = Zones(data.get("polygons"), data.get("tile_size"), data.get("overlap", 0.2),
+                          data.get("full_frame", True))
+        except (TypeError, ValueError) as e:
+            return {"message": f"Invalid zones: {e}", "success": False}, 400
+        if not zones.polygons and zones.tile_size is None:
+            zones = None
+        detector.set_zones(cam_id, zones)
+    zones = detector.zones.get(cam_id)
+    return zones.to_dict() if zones is not None else {"polygons": [], "tile_size": None}, 200
+
+def camera_stats_action(cam_id):
+    if cameras.get(cam_id) is None:
+        return camera_not_found(cam_id)
+    return camera_stats.get(cam_id, {"total_people": 0, "violations": 0}), 200
+
+def metrics_action():
+    """Per-stage latency histograms, FPS and dropped-frame counters of the pipeline."""
+    data = metrics.snapshot()
+    data["cameras"] = {
+        cam_id: {
+            "frames_dropped": cam.frames_dropped,
+            "viewers": broadcaster.viewers.get(cam_id, 0)
+        } for cam_id, cam in cameras.items()
+    }
+    data["detector"] = {
+        "inference_ms": round(detector.inference_time * 1000, 2) if detector.inference_time else None,
+        "latency_budget_ms": round(detector.latency_budget * 1000, 2) if detector.latency_budget else None,
+        "skip_interval": detector.skip_interval(max(1, len(cameras.ids())))
+    }
+    return data, 200
+
+def reply(result):
+    payload, status = result
+    return jsonify(payload), status
+
+# --- Flask routes ---
+
+@app.before_request
+def ensure_background_init():
+    start_background_init()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed/<cam_id>')
+def video_feed(cam_id=DEFAULT_CAMERA_ID):
+    if cameras.get(cam_id) is None:
+        return reply(camera_not_found(cam_id))
+    return Response(gen_frames(cam_id), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/api/cameras', methods=['GET'])
+def list_cameras():
+    return reply(list_cameras_action())
+
+@app.route('/api/cameras', methods=['POST'])
+def add_camera():
+    """Register a camera: {"id": "line2", "source": "http://192.168.1.X:81/stream"}"""
+    from flask import request
+    return reply(add_camera_action(request.json))
+
+@app.route('/api/cameras/<cam_id>', methods=['DELETE'])
+def remove_camera(cam_id):
+    return reply(remove_camera_action(cam_id))
 
 @app.route('/api/camera/status', methods=['GET'])
-def get_camera_status():
-    status = {
-        "source": camera.source,
-        "is_running": camera.is_running,
-        "stats": current_stats
-    }
-    return jsonify(status)
+@app.route('/api/camera/<cam_id>/status', methods=['GET'])
+def get_camera_status(cam_id=DEFAULT_CAMERA_ID):
+    return reply(camera_status_action(cam_id))
 
 @app.route('/api/camera/config', methods=['POST'])
-def set_camera_config():
+@app.route('/api/camera/<cam_id>/config', methods=['POST'])
+def set_camera_config(cam_id=DEFAULT_CAMERA_ID):
     """Set camera source (0, 1, or URL)"""
     from flask import request
-    data = request.json
-    new_source = data.get("source", 0)
-    
-    # Simple validation: if it looks like an int, cast it
-    if str(new_source).isdigit():
-        new_source = int(new_source)
-        
-    camera.set_source(new_source)
-    return jsonify({"message": f"Camera source set to {new_source}", "success": True})
+    return reply(camera_config_action(cam_id, request.json))
 
 @app.route('/api/camera/toggle', methods=['POST'])
-def toggle_camera():
+@app.route('/api/camera/<cam_id>/toggle', methods=['POST'])
+def toggle_camera(cam_id=DEFAULT_CAMERA_ID):
     """Start or Stop the camera stream"""
     from flask import request
-    data = request.json
-    action = data.get("action", "start") # "start" or "stop"
-    
-    if action == "stop":
-        camera.stop()
-        return jsonify({"message": "Camera stopped", "is_running": False})
-    else:
-        camera.start()
-        return jsonify({"message": "Camera started", "is_running": True})
+    return reply(camera_toggle_action(cam_id, request.json))
+
+@app.route('/api/camera/zones', methods=['GET', 'POST'])
+@app.route('/api/camera/<cam_id>/zones', methods=['GET', 'POST'])
+def camera_zones(cam_id=DEFAULT_CAMERA_ID):
+    """Zones of interest / tiled inference of a camera"""
+    from flask import request
+    return reply(camera_zones_action(cam_id, request.json if request.method == 'POST' else None))
 
 @app.route('/api/status')
 def api_status():
-    return jsonify(current_stats)
+    return reply(status_action())
+
+@app.route('/healthz')
+def healthz():
+    return reply(healthz_action())
+
+@app.route('/readyz')
+def readyz():
+    return reply(readyz_action())
+
+@app.route('/api/stream')
+def api_stream():
+    """Server-Sent Events: pushes the stats whenever they change (new EventSource('/api/stream'))."""
+    return Response(stats_publisher.events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/metrics')
+def api_metrics():
+    return reply(metrics_action())
+
+@app.route('/api/status/<cam_id>')
+def api_camera_stats(cam_id):
+    return reply(camera_stats_action(cam_id))
 
 if __name__ == '__main__':
+    start_background_init()
     # Threaded=True is important for streaming multiple clients (if needed)
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True, use_reloader=False)
@@ -0,0 +1,247 @@
+"""
+Asyncio serving mode for many concurrent viewers (control-room walls, tablets).
+
+    python async_app.py
+
+Same cameras, detector, broadcaster and API as app.py, but served by ONE aiohttp event loop:
+every /video_feed viewer is a coroutine instead of an OS thread, so memory and thread
+count stay flat as viewers are added. Blocking camera operations (connect, stop)
+run on the default executor.
+"""
+import asyncio
+import os
+
+import app as core # cameras, detector, broadcaster and the API actions
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, '..', 'templates')
+STATIC_DIR = os.path.join(BASE_DIR, '..', 'static')
+
+class AsyncFanout:
+    """
+    Wakes up the asyncio viewers of a camera when the broadcaster publishes a frame.
+    The broadcaster runs in its own thread, so it only schedules the wake-up on the loop.
+    """
+    def __init__(self, loop):
+        self.loop = loop
+        self.events = {} # cam_id -> asyncio.Event that fires on the next frame
+
+    def event(self, cam_id):
+        event = self.events.get(cam_id)
+        if event is None:
+            event = asyncio.Event()
+            self.events[cam_id] = event
+        return event
+
+    def notify_threadsafe(self, cam_id):
+        """Broadcaster listener (called from the producer / encoder threads)."""
+        self.loop.call_soon_threadsafe(self._notify, cam_id)
+
+    def _notify(self, cam_id):
+        event = self.events.pop(cam_id, None)
+        if event is not None:
+            event.set()
+
+def json_reply(result):
+    payload, status = result
+    return web.json_response(payload, status=status)
+
+async def run_blocking(func, *args):
+    """Run a blocking API action (camera connect/stop) without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return {}
+
+# --- Handlers ---
+
+async def index(request):
+    return web.FileResponse(os.path.join(TEMPLATE_DIR, 'index.html'))
+
+async def video_feed(request):
+    cam_id = request.match_info.get('cam_id', core.DEFAULT_CAMERA_ID)
+    if core.cameras.get(cam_id) is None:
+        return json_reply(core.camera_not_found(cam_id))
+
+    fanout = request.app['fanout']
+    response = web.StreamResponse(headers={
+        'Content-Type': 'multipart/x-mixed-replace; boundary=frame',
+        'Cache-Control': 'no-cache'
+    })
+    await response.prepare(request)
+
+    core.broadcaster.start()
+    core.broadcaster.add_viewer(cam_id)
+    last_seq = 0
+    try:
+        while True:
+            # Take the event BEFORE looking at the latest frame, so a publish in between isn't missed
+            event = fanout.event(cam_id)
+            seq, frame_bytes = core.broadcaster.latest_frame(cam_id)
+            if seq == last_seq:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            last_seq = seq
+
+            # Slow socket -> only this coroutine waits; it then jumps to the newest frame
+            await response.write(b'--frame\r\n'
+                                 b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    except (ConnectionResetError, ConnectionError):
+        pass # Client disconnected
+    finally:
+        core.broadcaster.remove_viewer(cam_id)
+    return response
+
+async def api_stream(request):
+    """Server-Sent Events: pushes the stats whenever they change."""
+    fanout = request.app['stats_fanout']
+    publisher = core.stats_publisher
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Access-Control-Allow-Origin': '*'
+    })
+    await response.prepare(request)
+
+    last_version = 0
+    try:
+        while True:
+            event = fanout.event('stats')
+            version, message = publisher.latest_message()
+            if version == last_version:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=publisher.keepalive)
+                except asyncio.TimeoutError:
+                    await response.write(b": keepalive\n\n")
+                continue
+            last_version = version
+            await response.write(message)
+    except (ConnectionResetError, ConnectionError):
+        pass # Client disconnected
+    return response
+
+async def list_cameras(request):
+    return json_reply(core.list_cameras_action())
+
+async def add_camera(request):
+    data = await read_json(request)
+    return json_reply(await run_blocking(core.add_camera_action, data))
+
+async def remove_camera(request):
+    return json_reply(await run_blocking(core.remove_camera_action, request.match_info['cam_id']))
+
+async def camera_status(request):
+    return json_reply(core.camera_status_action(request.match_info.get('cam_id', core.DEFAULT_CAMERA_ID)))
+
+async def camera_config(request):
+    data = await read_json(request)
+    cam_id = request.match_info.get('cam_id', core.DEFAULT_CAMERA_ID)
+    return json_reply(await run_blocking(core.camera_config_action, cam_id, data))
+
+async def camera_toggle(request):
+    data = await read_json(request)
+    cam_id = request.match_info.get('cam_id', core.DEFAULT_CAMERA_ID)
+    return json_reply(await run_blocking(core.camera_toggle_action, cam_id, data))
+
+async def camera_zones(request):
+    cam_id = request.match_info.get('cam_id', core.DEFAULT_CAMERA_ID)
+    data = await read_json(request) if request.method == 'POST' else None
+    return json_reply(core.camera_zones_action(cam_id, data))
+
+async def api_status(request):
+    return json_reply(core.status_action())
+
+async def healthz(request):
+    return json_reply(core.healthz_action())
+
+async def readyz(request):
+    return json_reply(core.readyz_action())
+
+async def api_camera_stats(request):
+    return json_reply(core.camera_stats_action(request.match_info['cam_id']))
+
+async def api_metrics(request):
+    return json_reply(core.metrics_action())
+
+# --- App ---
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+def cors_middleware():
+    # Same behaviour as CORS(app) in app.py (dashboard runs on another port)
+    @web.middleware
+    async def middleware(request, handler):
+        if request.method == 'OPTIONS':
+            return web.Response(headers=CORS_HEADERS)
+        response = await handler(request)
+        if not response.prepared:
+            response.headers.update(CORS_HEADERS)
+        return response
+    return middleware
+
+async def on_startup(application):
+    fanout = AsyncFanout(asyncio.get_running_loop())
+    application['fanout'] = fanout
+    core.broadcaster.listeners.append(fanout.notify_threadsafe)
+
+    stats_fanout = AsyncFanout(asyncio.get_running_loop())
+    application['stats_fanout'] = stats_fanout
+    application['stats_listener'] = lambda: stats_fanout.notify_threadsafe('stats')
+    core.stats_publisher.listeners.append(application['stats_listener'])
+    # Model loads in the background, the server is already answering (see /readyz)
+    core.start_background_init()
+
+async def on_cleanup(application):
+    core.broadcaster.listeners.remove(application['fanout'].notify_threadsafe)
+    core.stats_publisher.listeners.remove(application['stats_listener'])
+
+def create_app():
+    application = web.Application(middlewares=[cors_middleware()])
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    application.router.add_get('/', index)
+    application.router.add_static('/static', STATIC_DIR)
+    application.router.add_get('/video_feed', video_feed)
+    application.router.add_get('/video_feed/{cam_id}', video_feed)
+    application.router.add_get('/api/cameras', list_cameras)
+    application.router.add_post('/api/cameras', add_camera)
+    application.router.add_delete('/api/cameras/{cam_id}', remove_camera)
+    application.router.add_get('/api/camera/status', camera_status)
+    application.router.add_get('/api/camera/{cam_id}/status', camera_status)
+    application.router.add_post('/api/camera/config', camera_config)
+    application.router.add_post('/api/camera/{cam_id}/config', camera_config)
+    application.router.add_post('/api/camera/toggle', camera_toggle)
+    application.router.add_post('/api/camera/{cam_id}/toggle', camera_toggle)
+    application.router.add_get('/api/camera/zones', camera_zones)
+    application.router.add_post('/api/camera/zones', camera_zones)
+    application.router.add_get('/api/camera/{cam_id}/zones', camera_zones)
+    application.router.add_post('/api/camera/{cam_id}/zones', camera_zones)
+    application.router.add_get('/api/status', api_status)
+    application.router.add_get('/api/status/{cam_id}', api_camera_stats)
+    application.router.add_get('/api/stream', api_stream)
+    application.router.add_get('/api/metrics', api_metrics)
+    application.router.add_get('/healthz', healthz)
+    application.router.add_get('/readyz', readyz)
+    return application
+
+if __name__ == '__main__':
+    if web is None:
+        print("Error: 'aiohttp' not found. Install it (pip install aiohttp) or run app.py instead.")
+    else:
+        web.run_app(create_app(), host='0.0.0.0', port=5000)
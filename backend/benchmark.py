@@ -0,0 +1,314 @@
+"""
+Reproducible benchmarks of the detection / streaming hot path. Runs offline: synthetic frames,
+a deterministic stub model (no best.pt, no ultralytics) and a synthetic camera.
+
+    python benchmark.py                      # run and print
+    python benchmark.py --save               # run and write benchmark_baseline.json
+    python benchmark.py --compare            # run and compare with benchmark_baseline.json
+
+Measured:
+    postprocess/<N>_boxes   PPE_Detector._process_result with N raw model boxes (tracking on)
+    detect/<N>_boxes        detect_batch(headless=True) on one frame, stub model included (no tracking)
+    annotate/<N>_boxes      PPE_Detector.annotate
+    encode/<W>x<H>_q<Q>     VideoCamera.get_jpg_bytes
+    pipeline/fps            frames/s a /video_feed viewer receives (FrameBroadcaster.frames)
+--compare exits with status 1 if a timing got more than --tolerance slower (fps: lower).
+Numbers are only comparable on the same machine: save a baseline there before changing code
+(it isn't committed). --compare refuses (status 2) a baseline recorded with another CPU count or
+Python / numpy / OpenCV version, --force compares anyway.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from camera import CameraManager, VideoCamera
+from broadcaster import FrameBroadcaster
+from detector import PPE_Detector, CLASS_MAP
+import inference
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BASE_DIR, 'benchmark_baseline.json')
+BOX_COUNTS = (0, 10, 50, 100, 300)
+# Environment entries that must match for timings to be comparable (the commit is what changes)
+COMPARABLE_KEYS = ('python', 'numpy', 'opencv', 'machine', 'cpus')
+# Pipeline settings of the production server (keep in sync with app.py)
+JPEG_QUALITY = 80
+JPEG_SCALE = 1.0
+ENCODE_WORKERS = 2
+
+class StubModel:
+    """
+    Stands in for YOLO: returns `boxes` deterministic detections per image (same seed -> same
+    boxes), spread over all classes, with persons carrying hardhats / vests like real scenes.
+    """
+    def __init__(self, boxes=50, seed=0):
+        self.names = dict(CLASS_MAP)
+        self.boxes = boxes
+        self.seed = seed
+        self.calls = 0
+
+    def make_result(self, frame, boxes=None, seed=None):
+        boxes = self.boxes if boxes is None else boxes
+        rng = np.random.default_rng(self.seed if seed is None else seed)
+        h, w = frame.shape[:2]
+        data = np.zeros((boxes, 6), dtype=np.float32)
+        people = boxes // 3
+        # People with a hat on the head and a vest on the body (some get lost below -> violations)
+        px1 = rng.uniform(0, w - 80, people)
+        py1 = rng.uniform(0, h - 200, people)
+        pw = rng.uniform(40, 80, people)
+        ph = rng.uniform(120, 200, people)
+        data[:people] = np.stack([px1, py1, px1 + pw, py1 + ph, rng.uniform(0.3, 0.95, people),
+                                  np.full(people, 3)], axis=1)
+        gear = min(people, (boxes - people) // 2)
+        hx1 = px1[:gear] + pw[:gear] * 0.2
+        hy1 = py1[:gear] - ph[:gear] * 0.02
+        data[people:people + gear] = np.stack([hx1, hy1, hx1 + pw[:gear] * 0.6, hy1 + ph[:gear] * 0.15,
+                                               rng.uniform(0.2, 0.9, gear), np.zeros(gear)], axis=1)
+        data[people + gear:people + 2 * gear] = np.stack(
+            [px1[:gear], py1[:gear] + ph[:gear] * 0.35, px1[:gear] + pw[:gear], py1[:gear] + ph[:gear] * 0.7,
+             rng.uniform(0.2, 0.9, gear), np.full(gear, 4)], axis=1)
+        # Everything else: random small boxes of any class
+        rest = boxes - people - 2 * gear
+        rx1 = rng.uniform(0, w - 40, rest)
+        ry1 = rng.uniform(0, h - 40, rest)
+        data[people + 2 * gear:] = np.stack([rx1, ry1, rx1 + rng.uniform(8, 40, rest), ry1 + rng.uniform(8, 40, rest),
+                                             rng.uniform(0.1, 0.9, rest), rng.integers(0, 9, rest)], axis=1)
+        return inference.Result(self.names, data)
+
+    def __call__(self, frames, verbose=False, conf=0.25, **kwargs):
+        results = []
+        for frame in frames:
+            results.append(self.make_result(frame, seed=self.seed + self.calls))
+            self.calls += 1
+        return results
+
+def synthetic_frame(width=640, height=480, seed=0):
+    """Deterministic frame with texture (so JPEG sizes / encode times are realistic)."""
+    rng = np.random.default_rng(seed)
+    frame = cv2.resize(rng.integers(0, 255, (height // 8, width // 8, 3), dtype=np.uint8), (width, height))
+    for _ in range(12):
+        x, y = int(rng.integers(0, width - 60)), int(rng.integers(0, height - 60))
+        cv2.rectangle(frame, (x, y), (x + 60, y + 60), tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+    return frame
+
+class SyntheticCapture:
+    """cv2.VideoCapture look-alike: an endless moving scene delivered at `fps` frames per second."""
+    def __init__(self, fps=120, width=640, height=480, period=60):
+        background = synthetic_frame(width, height)
+        self.frames = []
+        for i in range(period):
+            frame = background.copy()
+            x = (i * 8) % (width - 80)
+            cv2.rectangle(frame, (x, 100), (x + 80, 300), (40, 200, 40), -1)
+            self.frames.append(frame)
+        self.interval = 1.0 / fps
+        self.next_time = time.perf_counter()
+        self.index = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        delay = self.next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_time = max(self.next_time + self.interval, time.perf_counter() - self.interval)
+        self.index += 1
+        return True, self.frames[self.index % len(self.frames)]
+
+    def release(self):
+        pass
+
+class SyntheticCamera(VideoCamera):
+    """VideoCamera reading from a SyntheticCapture instead of a real source."""
+    def __init__(self, fps=120, **kwargs):
+        self.fps = fps
+        super().__init__(source='synthetic', **kwargs)
+
+    def _create_capture(self, source):
+        return SyntheticCapture(self.fps)
+
+def add_synthetic_camera(cameras, cam_id, fps=120):
+    camera = SyntheticCamera(fps, threaded=cameras.threaded, jpeg_quality=cameras.jpeg_quality,
+                             jpeg_scale=cameras.jpeg_scale)
+    with cameras.lock:
+        cameras.cameras[cam_id] = camera
+    return camera
+
+def make_detector(boxes=50):
+    # lazy=True: never loads best.pt, the stub model is plugged in instead
+    detector = PPE_Detector(lazy=True)
+    detector.model = StubModel(boxes)
+    detector.loaded = True
+    return detector
+
+def time_call(func, repeat, warmup=3):
+    """Median and p95 duration (ms) of func() over `repeat` runs."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {"median_ms": round(samples[len(samples) // 2], 4),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4)}
+
+# --- Benchmarks ---
+
+def bench_detection(repeat):
+    results = {}
+    frame = synthetic_frame()
+    for boxes in BOX_COUNTS:
+        detector = make_detector(boxes)
+        stub = detector.model
+        result = stub.make_result(frame)
+        state = detector._stream_state('bench')
+        results[f"postprocess/{boxes}_boxes"] = time_call(lambda: detector._process_result(frame, result, state), repeat)
+        results[f"detect/{boxes}_boxes"] = time_call(lambda: detector.detect_batch([frame], headless=True), repeat)
+        detections, _ = detector._process_result(frame, result)
+        results[f"annotate/{boxes}_boxes"] = time_call(lambda: detector.annotate(frame, detections), repeat)
+    return results
+
+def bench_encode(repeat):
+    results = {}
+    for width, height in ((640, 480), (1280, 720)):
+        frame = synthetic_frame(width, height)
+        for quality in (80, 60):
+            camera = SyntheticCamera(jpeg_quality=quality)
+            # No cache key: every call really encodes
+            results[f"encode/{width}x{height}_q{quality}"] = time_call(lambda: camera.get_jpg_bytes(frame), repeat)
+    return results
+
+def bench_pipeline(duration, source_fps=120, boxes=50):
+    """
+    Frames/s delivered to one viewer by the real FrameBroadcaster (detect, annotate, encode),
+    fed by a synthetic camera faster than real ones so the pipeline is the bottleneck.
+    """
+    cameras = CameraManager(threaded=True, jpeg_quality=JPEG_QUALITY, jpeg_scale=JPEG_SCALE)
+    add_synthetic_camera(cameras, 'bench', source_fps)
+    broadcaster = FrameBroadcaster(cameras, make_detector(boxes), encode_workers=ENCODE_WORKERS)
+
+    counts = [0]
+    first_frame = threading.Event()
+    def viewer():
+        for _ in broadcaster.frames('bench'):
+            counts[0] += 1
+            first_frame.set()
+    threading.Thread(target=viewer, daemon=True).start()
+    if not first_frame.wait(timeout=30):
+        raise RuntimeError("pipeline didn't deliver a frame within 30s")
+
+    start_count, start = counts[0], time.perf_counter()
+    time.sleep(duration)
+    received, elapsed = counts[0] - start_count, time.perf_counter() - start
+    cameras.remove('bench')
+    return {"pipeline/fps": {"fps": round(received / elapsed, 2), "source_fps": source_fps}}
+
+# --- Baseline ---
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count()
+    }
+
+def environment_mismatch(current, saved):
+    """{key: (baseline value, current value)} of the COMPARABLE_KEYS that differ."""
+    return {key: (saved.get(key), current.get(key)) for key in COMPARABLE_KEYS if saved.get(key) != current.get(key)}
+
+def compare(results, baseline, tolerance, min_delta_ms=0.1):
+    """
+    Print changes vs. the baseline. Returns the names of the regressed benchmarks: slower by more
+    than `tolerance` and (timings) by more than min_delta_ms, so sub-0.1 ms jitter doesn't count.
+    """
+    regressions = []
+    for name, values in sorted(results.items()):
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            print(f"  {name:<28} new")
+            continue
+        if "fps" in values:
+            new_value, old_value, worse = values["fps"], old["fps"], values["fps"] < old["fps"] * (1 - tolerance)
+            unit = "fps"
+        else:
+            new_value, old_value = values["median_ms"], old["median_ms"]
+            worse = new_value > old_value * (1 + tolerance) and new_value - old_value > min_delta_ms
+            unit = "ms"
+        change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+        flag = "  REGRESSION" if worse else ""
+        print(f"  {name:<28} {old_value:>10.3f} -> {new_value:>10.3f} {unit} ({change:+.1f}%){flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection / streaming hot path.")
+    parser.add_argument('--repeat', type=int, default=100, help="runs per timing")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds of the pipeline fps run")
+    parser.add_argument('--source-fps', type=int, default=120, help="frame rate of the synthetic camera")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--compare', action='store_true', help="compare with the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.1, help="ignore slowdowns smaller than this")
+    parser.add_argument('--force', action='store_true', help="compare even if the baseline environment differs")
+    parser.add_argument('--skip-pipeline', action='store_true')
+    args = parser.parse_args()
+
+    # Single-threaded OpenCV: less noise between runs, closer to a loaded edge box
+    cv2.setNumThreads(1)
+    results = {}
+    results.update(bench_detection(args.repeat))
+    results.update(bench_encode(args.repeat))
+    if not args.skip_pipeline:
+        results.update(bench_pipeline(args.duration, args.source_fps))
+
+    report = {"environment": environment(), "results": results}
+    print(json.dumps(report, indent=2))
+
+    exit_code = 0
+    if args.compare and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}: run with --save on this machine first.")
+        exit_code = 2
+    elif args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        mismatch = environment_mismatch(report["environment"], baseline.get("environment", {}))
+        differences = ", ".join(f"{key} {old} -> {new}" for key, (old, new) in mismatch.items())
+        if mismatch and not args.force:
+            print(f"Not compared, the baseline was recorded in another environment ({differences}). "
+                  f"Save a new one with --save, or use --force.")
+            exit_code = 2
+        else:
+            if mismatch:
+                print(f"Warning: baseline environment differs ({differences}), timings may not be comparable.")
+            print(f"Compared with {args.baseline} (commit {baseline.get('environment', {}).get('commit')}):")
+            if compare(results, baseline, args.tolerance, args.min_delta_ms):
+                exit_code = 1
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    return exit_code
+
+if __name__ == '__main__':
+    raise SystemExit(main())
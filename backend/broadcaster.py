@@ -0,0 +1,190 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import metrics
+
+class FrameBroadcaster:
+    """
+    Runs capture -> detect -> encode ONCE per frame in a single producer thread
+    and fans the latest JPEG of each camera out to every /video_feed viewer.
+    The newest frame of every camera is grouped into one batched model call.
+    Slow viewers simply skip to the newest frame instead of holding the pipeline back.
+    Annotating + JPEG encoding run in a small worker pool, so the next batch's inference
+    overlaps with encoding the current one.
+    camera_stats / current_stats hold the stats of every camera and their total; they are
+    pushed to stats_publisher (see StatsPublisher in app.py) if one is given.
+    """
+    def __init__(self, cameras, detector, encode_workers=2, stats_publisher=None):
+        self.cameras = cameras
+        self.detector = detector
+        self.stats_publisher = stats_publisher
+        self.camera_stats = {}    # cam_id -> stats of that camera
+        # Total over all cameras (what /api/status has always returned)
+        self.current_stats = {"total_people": 0, "violations": 0}
+        self.encode_pool = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix='encode')
+        self.pending = {}         # cam_id -> Future of the frame being encoded
+        self.condition = threading.Condition()
+        self.latest = {}          # cam_id -> (seq, jpeg bytes)
+        self.camera_seqs = {}     # cam_id -> last camera frame seq we processed
+        self.camera_switches = {} # cam_id -> camera.source_switches when we last saw it
+        self.placeholder_time = {} # cam_id -> last time a black placeholder was published
+        self.viewers = {}         # cam_id -> number of open /video_feed streams
+        self.listeners = []       # callables(cam_id) run after every publish (e.g. the asyncio server)
+        self.thread = None
+
+    def start(self):
+        """Start the producer thread (safe to call more than once)."""
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _next_frame(self, cam_id, camera):
+        """
+        Returns (frame, needs_detection, key). key identifies the frame for the JPEG cache.
+        frame is None if the camera has nothing new since the last call.
+        """
+        if camera.threaded and camera.is_running:
+            if self.camera_switches.get(cam_id, camera.source_switches) != camera.source_switches:
+                # New source took over (switch / reconnect): its frames have nothing to do with
+                # the last detections, don't propagate them
+                self.detector.reset_stream(cam_id)
+            self.camera_switches[cam_id] = camera.source_switches
+            frame, seq, _ = camera.get_latest_frame()
+            if frame is not None:
+                if seq == self.camera_seqs.get(cam_id):
+                    return None, False, None
+                self.camera_seqs[cam_id] = seq
+                return frame, True, seq
+        elif camera.is_running:
+            # Non-threaded camera: blocking read
+            return camera.get_frame(), True, None
+
+        # Stopped / not delivering yet -> black placeholder, at most once per second
+        now = time.time()
+        if now - self.placeholder_time.get(cam_id, 0) < 1.0:
+            return None, False, None
+        self.placeholder_time[cam_id] = now
+        return np.zeros((480, 640, 3), dtype=np.uint8), False, 'placeholder'
+
+    def is_watched(self, cam_id):
+        return self.viewers.get(cam_id, 0) > 0
+
+    def add_viewer(self, cam_id):
+        with self.condition:
+            self.viewers[cam_id] = self.viewers.get(cam_id, 0) + 1
+
+    def remove_viewer(self, cam_id):
+        with self.condition:
+            self.viewers[cam_id] -= 1
+
+    def latest_frame(self, cam_id):
+        """(seq, jpeg bytes) of the newest encoded frame of a camera, (0, None) if none yet."""
+        with self.condition:
+            return self.latest.get(cam_id, (0, None))
+
+    def _submit_render(self, cam_id, camera, frame, detections, key):
+        """Annotate + encode in the worker pool. At most one frame in flight per camera."""
+        pending = self.pending.get(cam_id)
+        if pending is not None and not pending.done():
+            # Encoder is behind: drop this frame for the viewers, a newer one follows
+            metrics.incr('encode_skipped')
+            return
+        self.pending[cam_id] = self.encode_pool.submit(self._render, cam_id, camera, frame, detections, key)
+
+    def _render(self, cam_id, camera, frame, detections, key):
+        try:
+            if detections is not None:
+                frame = self.detector.annotate(frame, detections)
+                key = None if key is None else ('annotated', key)
+            # Encode to JPEG and publish to this camera's viewers
+            self._publish(cam_id, camera.get_jpg_bytes(frame, key))
+        except Exception as e:
+            print(f"CRITICAL ERROR in encoder: {e}")
+
+    def _publish(self, cam_id, frame_bytes):
+        with self.condition:
+            seq = self.latest.get(cam_id, (0, None))[0] + 1
+            self.latest[cam_id] = (seq, frame_bytes)
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener(cam_id)
+
+    def _run(self):
+        print("Starting video stream loop...")
+        frame_count = 0
+        while True:
+            try:
+                batch_ids, batch_frames, batch_cameras, batch_keys = [], [], [], []
+                for cam_id, camera in self.cameras.items():
+                    frame, needs_detection, key = self._next_frame(cam_id, camera)
+                    if frame is None:
+                        continue
+                    if needs_detection:
+                        batch_ids.append(cam_id)
+                        batch_frames.append(frame)
+                        batch_cameras.append(camera)
+                        batch_keys.append(key)
+                    elif self.is_watched(cam_id):
+                        self._submit_render(cam_id, camera, frame, None, key)
+
+                if not batch_frames:
+                    time.sleep(0.005) # Wait for a camera to deliver a new frame
+                    continue
+
+                # Run Detection (one model call for all cameras, stats only)
+                results = self.detector.detect_batch(batch_frames, headless=True, stream_ids=batch_ids)
+
+                for cam_id, camera, frame, key, (detections, stats) in zip(batch_ids, batch_cameras, batch_frames, batch_keys, results):
+                    self.camera_stats[cam_id] = stats
+                    metrics.tick('frames_processed')
+                    # Nobody watching this camera -> skip drawing and encoding entirely
+                    if not self.is_watched(cam_id):
+                        continue
+                    self._submit_render(cam_id, camera, frame, detections, key)
+
+                # Update global stats (sum over all cameras still registered)
+                active_ids = set(self.cameras.ids())
+                for cam_id in list(self.camera_stats):
+                    if cam_id not in active_ids:
+                        del self.camera_stats[cam_id]
+                self.current_stats = {
+                    key: sum(s.get(key, 0) for s in self.camera_stats.values())
+                    for key in ("total_people", "violations", "unique_people", "unique_violations")
+                }
+                if self.stats_publisher is not None:
+                    self.stats_publisher.update(self.current_stats)
+
+                frame_count += 1
+                metrics.tick('batches_processed')
+                metrics.log('stream_alive', f"Stream is alive! Processed {frame_count} batches ({len(batch_frames)} camera(s) in last batch).", interval=30.0)
+
+            except Exception as e:
+                metrics.incr('pipeline_errors')
+                print(f"CRITICAL ERROR in gen_frames: {e}")
+                time.sleep(1) # Prevent spamming loop on error
+
+    def frames(self, cam_id):
+        """Generator for one viewer of one camera. Yields MJPEG parts of the newest frames only."""
+        self.start()
+        last_seq = 0
+        self.add_viewer(cam_id)
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.latest.get(cam_id, (0, None))[0] != last_seq, timeout=1.0)
+                    seq, frame_bytes = self.latest.get(cam_id, (0, None))
+                    if seq == last_seq:
+                        continue
+                    last_seq = seq
+
+                # Yield frame in MJPEG format
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        finally:
+            # Client disconnected
+            self.remove_viewer(cam_id)
@@ -1,23 +1,101 @@
 import cv2
 import time
+import threading
 import requests
+from collections import OrderedDict
 import numpy as np
+from metrics import metrics
 
 class VideoCamera:
-    def __init__(self, source=0):
+    def __init__(self, source=0, threaded=False, jpeg_quality=80, jpeg_scale=1.0, lazy=False,
+                 backoff_min=0.5, backoff_max=30.0, stall_timeout=5.0):
         """
         Initialize video camera.
         source: 
           - Integer (0, 1) for local webcam.
           - String (URL) for IP camera / ESP32 stream.
+        threaded:
+          - If True, a background reader thread keeps draining the source and
+            only the newest frame is kept. get_frame() then never blocks on
+            the camera and never returns old buffered frames (ESP32 streams).
+          - Connecting is done by a background connector thread as well: set_source() returns
+            right away, the old source keeps streaming until the new one delivered its first frame.
+            Failed connections and dropped streams (no frame for stall_timeout seconds) are
+            retried with exponential backoff between backoff_min and backoff_max seconds.
+        jpeg_quality / jpeg_scale:
+          - JPEG quality (0-100) and output scale (e.g. 0.5 = half resolution) of get_jpg_bytes().
+        lazy:
+          - Threaded mode only: open the source in the connector thread instead of here, so creating
+            the camera never waits for cv2.VideoCapture (e.g. an unreachable ESP32 URL).
         """
         self.source = source
         self.video = None
         self.is_running = True
-        self.connect()
+        self.threaded = threaded
+        self.initializing = True  # until the first connection attempt has finished
+
+        # Latest-frame slot (threaded mode)
+        self.capture_lock = threading.Lock() # guards self.video / self.retired between reader and connector
+        self.frame_lock = threading.Lock()
+        self.latest_frame = None
+        self.frame_seq = 0        # increments for every frame read from the source
+        self.frame_time = 0.0     # time.time() when latest_frame was read
+        self.consumed_seq = 0     # last seq handed out by get_frame()
+        self.frames_dropped = 0   # frames overwritten before anyone consumed them
+        self.reader_thread = None
+        self.retired = []         # replaced captures, released by the reader once it isn't reading them
+
+        # Connection supervisor (threaded mode)
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.stall_timeout = stall_timeout
+        self.connect_lock = threading.Lock()
+        self.connect_wake = threading.Event() # interrupts the backoff wait (new source / stop)
+        self.connector_thread = None
+        self.connect_target = None    # source the connector is trying to open
+        self.connect_generation = 0   # bumped by every connect request, newest request wins
+        self.state = "connecting"     # connecting / connected / reconnecting / stopped
+        self.connect_attempts = 0     # failed attempts since the last successful connection
+        self.last_error = None
+        self.next_retry = None        # time.time() of the next attempt while backing off
+        self.source_switches = 0      # increments whenever a new capture is swapped in
+        self.last_frame_time = 0.0    # time.time() of the last frame read (stall detection)
+
+        # JPEG output
+        self.jpeg_quality = jpeg_quality
+        self.jpeg_scale = jpeg_scale
+        self.jpeg_cache = OrderedDict() # key (e.g. frame seq) -> encoded bytes, newest last
+        self.jpeg_cache_size = 8
+        self.jpeg_lock = threading.Lock()
+
+        if self.threaded and lazy:
+            self.start_reader()
+            self._request_connect(source)
+        else:
+            self.connect()
+            if self.threaded:
+                self.start_reader()
 
     def connect(self):
-        """Attempts to connect to the current source."""
+        """
+        Attempts to connect to the current source. Threaded cameras with a running reader
+        reconnect in the background instead (see _connect_loop()) and return immediately.
+        """
+        if self.threaded and self.reader_thread is not None and self.reader_thread.is_alive():
+            self._request_connect(self.source)
+            return
+
+        with self.capture_lock:
+            self._open_capture()
+
+        # Don't serve a frame from the previous source
+        with self.frame_lock:
+            self.latest_frame = None
+
+    def _create_capture(self, source):
+        return cv2.VideoCapture(source)
+
+    def _open_capture(self):
         if self.video is not None:
             self.video.release()
             
@@ -26,29 +104,261 @@ class VideoCamera:
         if isinstance(self.source, str) and self.source.isdigit():
              self.source = int(self.source)
 
-        self.video = cv2.VideoCapture(self.source)
+        self.video = self._create_capture(self.source)
         
         if self.video.isOpened():
             print(f"[Camera] Connected to {self.source}")
+            self.state = "connected"
         else:
             print(f"[Camera] Failed to connect to {self.source}")
             # Don't fallback automatically to webcam to ensure user knows their IP failed
             # self.video = None (keeps the failed object which isOpened() == False)
+            self.state = "reconnecting" if self.threaded else "disconnected"
+            self.last_error = "open failed"
+        self.initializing = False
+
+    def _request_connect(self, source, only_if_idle=False):
+        """
+        Ask the connector thread to (re)connect to source, starting it if needed. Never blocks.
+        only_if_idle: do nothing (returns False) if a connection attempt is already in progress,
+        so a reconnect of the current source never overrides a pending source switch.
+        """
+        with self.connect_lock:
+            idle = self.connector_thread is None or not self.connector_thread.is_alive()
+            if only_if_idle and not idle:
+                return False
+            self.connect_target = source
+            self.connect_generation += 1
+            self.connect_wake.set()
+            if idle:
+                self.connector_thread = threading.Thread(target=self._connect_loop, daemon=True)
+                self.connector_thread.start()
+        return True
+
+    def _is_current(self, source):
+        """True if source is the active source and its capture is open (nothing to connect)."""
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        with self.capture_lock:
+            return source == self.source and self.video is not None and self.video.isOpened()
+
+    def _try_open(self, source):
+        """Open source and read its first frame. Returns (capture, frame) or (None, error message)."""
+        if isinstance(source, str) and source.isdigit():
+            source = int(source)
+        capture = self._create_capture(source)
+        if not capture.isOpened():
+            capture.release()
+            return None, "open failed"
+        success, frame = capture.read()
+        if not success:
+            capture.release()
+            return None, "no frames"
+        return capture, frame
+
+    def _connect_loop(self):
+        """
+        Connector thread: opens the newest requested source, retrying with exponential backoff.
+        Runs until the latest request succeeded (or the camera is stopped); the reader keeps
+        streaming the current capture meanwhile, the new one is only swapped in with a frame.
+        """
+        delay = self.backoff_min
+        done_generation = None
+        while True:
+            with self.connect_lock:
+                if not self.is_running or self.connect_generation == done_generation:
+                    self.connector_thread = None
+                    return
+                source, generation = self.connect_target, self.connect_generation
+                self.connect_wake.clear()
+            if self._is_current(source):
+                # Switched back to the source that is still streaming: a second connection would
+                # fail on single-client sources (ESP32), and there is nothing to do anyway
+                done_generation = generation
+                delay = self.backoff_min
+                self.connect_attempts = 0
+                self.last_error = None
+                continue
+
+            print(f"[Camera] Connecting to source: {source}")
+            capture, result = self._try_open(source)
+            with self.connect_lock:
+                superseded = generation != self.connect_generation
+            if capture is not None and not superseded:
+                if self._swap_capture(source, capture, result):
+                    print(f"[Camera] Connected to {source}")
+                    done_generation = generation
+                    delay = self.backoff_min
+                else:
+                    capture.release() # stopped while connecting, the loop exits
+                continue
+            if capture is not None:
+                capture.release()
+            if superseded:
+                # A newer source was requested while this one was opening, try that one right away
+                delay = self.backoff_min
+                continue
+
+            self.connect_attempts += 1
+            self.last_error = result
+            self.initializing = False
+            self.next_retry = time.time() + delay
+            metrics.incr('connect_failures')
+            print(f"[Camera] Failed to connect to {source} ({result}), retrying in {delay:.1f}s")
+            self.connect_wake.wait(delay) # a new request / stop() cuts the wait short
+            self.next_retry = None
+            delay = min(delay * 2, self.backoff_max)
+
+    def _swap_capture(self, source, capture, frame):
+        """Make capture (already delivering, first frame given) the active one. False if stopped meanwhile."""
+        with self.capture_lock:
+            if not self.is_running:
+                return False
+            if self.video is not None:
+                self.retired.append(self.video)
+            self.video = capture
+            if isinstance(source, str) and source.isdigit():
+                source = int(source)
+            self.source = source
+            self.source_switches += 1
+        with self.frame_lock:
+            self.frame_seq += 1
+            self.frame_time = time.time()
+            self.latest_frame = frame
+        self.state = "connected"
+        self.connect_attempts = 0
+        self.last_error = None
+        self.initializing = False
+        self.last_frame_time = time.time()
+        return True
 
     def set_source(self, new_source):
+        """
+        Switch to a new source. Threaded: returns immediately, the current source keeps
+        streaming until the new one produced its first frame (see connection_status()).
+        """
+        if self.threaded:
+            # Same source, still open: no-op (also cancels a pending switch to another source)
+            with self.connect_lock:
+                busy = self.connector_thread is not None and self.connector_thread.is_alive()
+            if self._is_current(new_source) and not busy:
+                return
+            self._request_connect(new_source)
+            return
         self.source = new_source
         self.connect()
 
+    def connection_status(self):
+        """Connection state for the status API."""
+        with self.connect_lock:
+            pending = self.connect_target if self.connector_thread is not None else None
+        if pending is not None and pending == self.source:
+            pending = None # reconnecting to the same source, not a switch
+        return {
+            "state": self.state if self.is_running else "stopped",
+            "pending_source": pending,
+            "connect_attempts": self.connect_attempts,
+            "last_error": self.last_error,
+            "retry_in": None if self.next_retry is None else round(max(0.0, self.next_retry - time.time()), 1)
+        }
+
     def start(self):
         self.is_running = True
+        if self.threaded:
+            self.start_reader()
         if not self.video or not self.video.isOpened():
              self.connect()
 
     def stop(self):
         self.is_running = False
-        if self.video and self.video.isOpened():
-            self.video.release()
-        self.video = None
+        self.state = "stopped"
+        self.connect_wake.set() # connector exits on its own once is_running is False
+        # Reader thread exits on its own once is_running is False, and releases the capture
+        # itself if it is still blocked in read()
+        with self.capture_lock:
+            if self.video is not None:
+                self.retired.append(self.video)
+            self.video = None
+            reader_alive = self.reader_thread is not None and self.reader_thread.is_alive()
+        if not reader_alive:
+            self._release_retired()
+        with self.frame_lock:
+            self.latest_frame = None
+
+    def _release_retired(self):
+        with self.capture_lock:
+            retired, self.retired = self.retired, []
+        for capture in retired:
+            capture.release()
+
+    def start_reader(self):
+        """Start the background capture thread (threaded mode only)."""
+        if self.reader_thread is not None and self.reader_thread.is_alive():
+            return
+        self.reader_thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self.reader_thread.start()
+
+    def _reader_loop(self):
+        print(f"[Camera] Reader thread started for {self.source}")
+        self.last_frame_time = time.time()
+        while self.is_running:
+            # Captures replaced by the connector are released here, where nobody is reading them
+            if self.retired:
+                self._release_retired()
+            with self.capture_lock:
+                video = self.video
+            # read() runs outside the lock: a dead stream blocking it for the OpenCV timeout
+            # must not hold up the connector swapping in a new source
+            if video is None or not video.isOpened():
+                success, frame = False, None # connector is (re)connecting, it counts its attempts
+            else:
+                with metrics.timer('capture'):
+                    success, frame = video.read()
+                if not success:
+                    metrics.incr('capture_failures')
+
+            if not success:
+                # Stream dropped (Wi-Fi glitch, ESP32 reboot) or never opened: reconnect in the background
+                dead = video is None or not video.isOpened()
+                if (self.is_running and not self.initializing
+                        and (dead or time.time() - self.last_frame_time > self.stall_timeout)):
+                    # Drop the dead capture first: an ESP32 only serves one stream client at a time
+                    with self.capture_lock:
+                        if video is not None and self.video is video:
+                            self.video = None
+                            self.retired.append(video)
+                    # (a connection attempt already in progress, e.g. a source switch, takes over)
+                    if self._request_connect(self.source, only_if_idle=True):
+                        print(f"[Camera] No frames from {self.source}, reconnecting")
+                        self.state = "reconnecting"
+                        metrics.incr('reconnects')
+                time.sleep(0.05) # Don't spin on a dead source
+                continue
+            if video is not self.video:
+                continue # swapped out while reading, the new source already published a frame
+
+            self.last_frame_time = time.time()
+            metrics.tick('frames_captured')
+            with self.frame_lock:
+                # Previous frame was never picked up -> it is stale, drop it
+                if self.latest_frame is not None and self.consumed_seq < self.frame_seq:
+                    self.frames_dropped += 1
+                    metrics.incr('frames_dropped')
+                self.frame_seq += 1
+                self.frame_time = time.time()
+                self.latest_frame = frame
+        self._release_retired()
+        print(f"[Camera] Reader thread stopped for {self.source}")
+
+    def get_latest_frame(self):
+        """
+        Threaded mode: return (frame, seq, timestamp) of the newest frame without blocking.
+        frame is None if nothing has been read yet.
+        """
+        with self.frame_lock:
+            if self.latest_frame is not None:
+                self.consumed_seq = self.frame_seq
+            return self.latest_frame, self.frame_seq, self.frame_time
 
     def __del__(self):
         if self.video and self.video.isOpened():
@@ -59,13 +369,22 @@ class VideoCamera:
              # Return black frame if stopped
              return np.zeros((480, 640, 3), dtype=np.uint8)
 
+        if self.threaded:
+            frame, _, _ = self.get_latest_frame()
+            if frame is None:
+                # Nothing read yet (connecting / disconnected)
+                return np.zeros((480, 640, 3), dtype=np.uint8)
+            return frame
+
         if self.video is None or not self.video.isOpened():
             # Try to reconnect implicitly? Or just return black
             # For now, return black to indicate failure
             return np.zeros((480, 640, 3), dtype=np.uint8)
 
-        success, frame = self.video.read()
+        with metrics.timer('capture'):
+            success, frame = self.video.read()
         if not success:
+            metrics.incr('capture_failures')
             # If reading fails (e.g. stream disconnected), return black
             return np.zeros((480, 640, 3), dtype=np.uint8)
         
@@ -75,7 +394,81 @@ class VideoCamera:
         # frame = cv2.resize(frame, (640, 480))
         return frame
 
-    def get_jpg_bytes(self, frame):
-        """Convert a frame to jpg bytes for streaming"""
-        ret, jpeg = cv2.imencode('.jpg', frame)
-        return jpeg.tobytes()
+    def get_jpg_bytes(self, frame, key=None):
+        """
+        Convert a frame to jpg bytes for streaming.
+        key: optional cache key (e.g. the frame sequence number). Encoding the same key
+        again returns the cached bytes instead of re-encoding. Safe to call from worker threads.
+        """
+        if key is not None:
+            with self.jpeg_lock:
+                cached = self.jpeg_cache.get(key)
+            if cached is not None:
+                metrics.incr('encode_cache_hits')
+                return cached
+
+        with metrics.timer('encode'):
+            if self.jpeg_scale != 1.0:
+                h, w = frame.shape[:2]
+                size = (max(1, int(w * self.jpeg_scale)), max(1, int(h * self.jpeg_scale)))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            ret, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(self.jpeg_quality)])
+            frame_bytes = jpeg.tobytes()
+
+        if key is not None:
+            with self.jpeg_lock:
+                self.jpeg_cache[key] = frame_bytes
+                while len(self.jpeg_cache) > self.jpeg_cache_size:
+                    self.jpeg_cache.popitem(last=False)
+        return frame_bytes
+
+
+class CameraManager:
+    """
+    Registry of cameras keyed by camera ID (one entry per ESP32 / webcam on the floor).
+    """
+    def __init__(self, threaded=True, jpeg_quality=80, jpeg_scale=1.0, lazy=False):
+        self.threaded = threaded
+        self.lazy = lazy
+        self.jpeg_quality = jpeg_quality
+        self.jpeg_scale = jpeg_scale
+        self.cameras = {}
+        self.lock = threading.Lock()
+
+    def add(self, cam_id, source):
+        """Register a new camera, or switch the source of an existing one."""
+        cam_id = str(cam_id)
+        with self.lock:
+            camera = self.cameras.get(cam_id)
+        if camera is not None:
+            camera.set_source(source)
+            return camera
+
+        camera = VideoCamera(source=source, threaded=self.threaded,
+                             jpeg_quality=self.jpeg_quality, jpeg_scale=self.jpeg_scale, lazy=self.lazy)
+        with self.lock:
+            self.cameras[cam_id] = camera
+        print(f"[Camera] Registered camera '{cam_id}' -> {source}")
+        return camera
+
+    def remove(self, cam_id):
+        with self.lock:
+            camera = self.cameras.pop(str(cam_id), None)
+        if camera is None:
+            return False
+        camera.stop()
+        print(f"[Camera] Removed camera '{cam_id}'")
+        return True
+
+    def get(self, cam_id):
+        with self.lock:
+            return self.cameras.get(str(cam_id))
+
+    def items(self):
+        """Snapshot of (cam_id, camera) pairs, safe to iterate while cameras are added/removed."""
+        with self.lock:
+            return list(self.cameras.items())
+
+    def ids(self):
+        with self.lock:
+            return list(self.cameras.keys())
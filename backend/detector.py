@@ -1,255 +1,715 @@
 import cv2
+import importlib.util
 import numpy as np
 import time
+from metrics import metrics
+from tracker import IoUTracker, UniqueCounter
+import inference
+from zones import merge_detections
 
-try:
-    from ultralytics import YOLO
-except ImportError:
-    YOLO = None
+# Only check that ultralytics is installed: importing it (and torch) takes seconds,
+# so the actual import happens when the model is loaded (see PPE_Detector.load)
+HAS_ULTRALYTICS = importlib.util.find_spec('ultralytics') is not None
+if not HAS_ULTRALYTICS:
     print("Warning: 'ultralytics' not found. AI features disabled.")
 
+# Custom Mapping for Safety Model (Orbit-xboi4)
+# Since the model only returns IDs 0-4, we map them to standard safety classes.
+# This is a best-guess based on standard PPE datasets.
+# Adjust if labels are swapped (e.g. if 0 shows as 'No-Helmet' but is actually 'Helmet').
+CLASS_MAP = {
+    0: 'Hardhat',
+    1: 'NO-Hardhat',
+    2: 'NO-Safety Vest',
+    3: 'Person',
+    4: 'Safety Vest',
+    5: 'Safety Gloves',
+    6: 'Safety Boot',
+    7: 'Safety Glasses',
+    8: 'Mask'
+}
+
+def boxes_contain_centers(boxes, others, top=0.0, bottom=1.0, margin=0.0):
+    """
+    (N, M) bool matrix: does box i contain the center of box j?
+    top/bottom restrict the vertical band of box i (fractions of its height, e.g. 0..1/3 = head),
+    margin extends the band upwards (fraction of the height, e.g. a hardhat sticking out on top).
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    others = np.asarray(others, dtype=np.float64).reshape(-1, 4)
+    cx = (others[:, 0] + others[:, 2]) / 2
+    cy = (others[:, 1] + others[:, 3]) / 2
+    h = boxes[:, 3] - boxes[:, 1]
+    band_top = boxes[:, 1] + (top - margin) * h
+    band_bottom = boxes[:, 1] + bottom * h
+    return ((cx[None, :] >= boxes[:, 0:1]) & (cx[None, :] <= boxes[:, 2:3]) &
+            (cy[None, :] >= band_top[:, None]) & (cy[None, :] <= band_bottom[:, None]))
+
+def box_brightness_sums(frame, boxes):
+    """
+    Sum of max(B, G, R) (== the HSV V channel for 8-bit images) and pixel count
+    inside each (x1, y1, x2, y2) box, clipped like numpy slicing would.
+    Uses one summed-area table over the region covering all boxes.
+    """
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    h, w = frame.shape[:2]
+    x1 = np.clip(boxes[:, 0], 0, w)
+    y1 = np.clip(boxes[:, 1], 0, h)
+    x2 = np.clip(boxes[:, 2], x1, w)
+    y2 = np.clip(boxes[:, 3], y1, h)
+    areas = (x2 - x1) * (y2 - y1)
+    if not areas.any():
+        return np.zeros(len(boxes), dtype=np.int64), areas
+
+    # Only the part of the frame the candidates cover
+    rx1, ry1, rx2, ry2 = x1.min(), y1.min(), x2.max(), y2.max()
+    region = frame[ry1:ry2, rx1:rx2]
+    if region.ndim == 3:
+        b, g, r = cv2.split(region)[:3]
+        brightness = cv2.max(cv2.max(b, g), r)
+    else:
+        brightness = region
+    # float64 sums are exact for any realistic frame size (< 2^53)
+    table = cv2.integral(brightness, sdepth=cv2.CV_64F)
+
+    x1, x2 = x1 - rx1, x2 - rx1
+    y1, y2 = y1 - ry1, y2 - ry1
+    sums = table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+    return np.rint(sums).astype(np.int64), areas
+
+def person_violations(persons, hats, vests, explicit):
+    """
+    PPE verdict for each person box: True if the person has no hardhat on the head,
+    no vest on the body, or an explicit violation (NO-Hardhat / NO-Safety Vest) on them.
+    """
+    has_hat = boxes_contain_centers(persons, hats, top=0.0, bottom=1/3, margin=0.15).any(axis=1)
+    has_vest = boxes_contain_centers(persons, vests).any(axis=1)
+    has_explicit = boxes_contain_centers(persons, explicit).any(axis=1)
+    return ~has_hat | ~has_vest | has_explicit
+
+class StreamState:
+    """
+    Per-stream (per-camera) state of the detector: the last real detections and
+    the thumbnail of the frame they were computed on, so skipped frames can reuse them.
+    """
+    def __init__(self, track_window=60.0):
+        self.frames_since_inference = None # None = never ran the model on this stream
+        self.detections = []
+        self.stats = {"total_people": 0, "violations": 0}
+        self.reference_thumb = None
+        self.gate_thumb = None             # MotionGate thumbnail of the last inferred frame
+        self.last_inference_time = 0.0
+
+        # Tracking: persistent IDs + unique people / violators over the last track_window seconds
+        self.tracker = IoUTracker()
+        self.people = UniqueCounter(track_window)
+        self.violators = UniqueCounter(track_window)
+
 class PPE_Detector:
-    def __init__(self, model_path='best.pt'):
+    def __init__(self, model_path='best.pt', latency_budget=None, max_skip=10, motion_compensation=True,
+                 motion_gate=None, tracking=True, verdict_interval=1.0, track_window=60.0,
+                 backend='torch', imgsz=640, int8=False, threads=None, warmup=True, lazy=False):
         """
         Initialize the YOLOv8 model.
+        backend:
+          - 'torch': ultralytics/PyTorch on model_path (.pt).
+          - 'onnx' / 'openvino': exported model on the CPU (see inference.py), optionally INT8
+            quantized (int8=True). model_path may be the export or the .pt to export from.
+          imgsz is the model input size (smaller = faster, less accurate on small objects),
+          threads the number of CPU threads of the runtime (None = runtime default).
+          warmup runs the model on a blank frame at load time so the first real frame isn't slow.
+        lazy:
+          - Don't load the model in the constructor, call load() later (e.g. in a background thread).
+        latency_budget:
+          - None: run the model on every frame.
+          - Seconds per frame (e.g. 1/30): the model only runs every Nth frame of a stream,
+            with N = measured inference time / budget (capped at max_skip).
+            Frames in between reuse the last detections, shifted by a cheap per-box
+            motion estimate if motion_compensation is True.
+        motion_gate:
+          - Optional MotionGate (see motion.py). Frames of a stream that didn't change since
+            its last inference reuse the previous detections/stats without calling YOLO.
+        tracking:
+          - Give detections of a stream persistent track IDs. The hair filter and the per-person
+            PPE verdict are cached on the track and only re-checked every verdict_interval seconds.
+            Stats then also contain unique_people / unique_violations over the last track_window seconds.
         """
         self.model = None
-        
-        if YOLO is not None:
+        self.class_table = None       # per-class lookup arrays, see _class_table()
+        self.class_table_names = None
+
+        self.latency_budget = latency_budget
+        self.max_skip = max_skip
+        self.motion_compensation = motion_compensation
+        self.inference_time = None    # moving average of model time per image (seconds)
+        self.streams = {}             # stream_id -> StreamState
+        self.zones = {}               # stream_id -> Zones, streams without an entry use the whole frame
+        self.motion_gate = motion_gate
+        self.tracking = tracking
+        self.verdict_interval = verdict_interval
+        self.track_window = track_window
+        self.backend = backend
+        self.imgsz = imgsz
+        self.load_args = (model_path, backend, imgsz, int8, threads, warmup)
+        self.loaded = False           # True once load() finished (even if it fell back to Safe Mode)
+        self.fallback = False         # True if model_path failed and the COCO yolov8n.pt was loaded instead
+
+        if not lazy:
+            self.load()
+
+    def load(self):
+        """
+        Load (and warm up) the model. Called by __init__, or later from a background
+        thread with lazy=True so the web server can answer while the model loads.
+        Until then detect() returns empty stats and annotate() shows "MODEL WARMING UP".
+        """
+        model_path, backend, imgsz, int8, threads, warmup = self.load_args
+        model = None
+
+        if backend != 'torch':
+            print(f"Loading {backend}{' INT8' if int8 else ''} model from {model_path}...")
+            try:
+                model = inference.load_model(model_path, backend, imgsz, int8, threads)
+                print("Model loaded successfully.")
+                print("Classes:", model.names)
+            except Exception as e:
+                print(f"Error loading {backend} model: {e}")
+                print("Running in Safe Mode (No AI).")
+        elif HAS_ULTRALYTICS:
             print(f"Loading YOLO model from {model_path}...")
             try:
                 # ---------------------------------------------------------
                 # NOTE: To use the Roboflow model 'orbit-xboi4/safety-sbfwr'
                 # Download 'best.pt' and place it in the backend folder.
                 # ---------------------------------------------------------
-                self.model = YOLO(model_path)
+                model = inference.load_model(model_path, 'torch', imgsz, threads=threads)
                 print("Model loaded successfully.")
-                print("Classes:", self.model.names) # Print classes to console
+                print("Classes:", model.names) # Print classes to console
             except Exception as e:
                 print(f"Error loading model: {e}")
                 print("Trying default yolov8n.pt as fallback...")
                 try:
-                    self.model = YOLO('yolov8n.pt')
+                    model = inference.load_model('yolov8n.pt', 'torch', imgsz, threads=threads)
+                    self.fallback = True
                 except:
                     pass
         else:
             print("Running in Safe Mode (No AI). Install 'ultralytics' to fix.")
 
-    def detect(self, frame):
+        if model is not None and warmup:
+            try:
+                elapsed = inference.warm_up(model, imgsz)
+                # Seed the frame-skip estimate so the first frames already respect the latency budget
+                self._record_inference_time(elapsed)
+                print(f"Model warmed up ({elapsed * 1000:.0f} ms per frame).")
+            except Exception as e:
+                print(f"Warm-up failed: {e}")
+
+        # Publish the model only once it is warm, detect() may already be running in another thread
+        self.model = model
+        self.loaded = True
+
+    def detect(self, frame, headless=False, stream_id=None):
         """
         Run detection on a single frame.
+        Returns (annotated_frame, stats).
+        headless=True skips all drawing and frame copies and returns (detections, stats)
+        instead - used when nobody is watching the stream but the stats must stay current.
+        stream_id identifies the camera for frame skipping (None = always run the model).
+        """
+        return self.detect_batch([frame], headless=headless, stream_ids=[stream_id])[0]
+
+    def detect_batch(self, frames, headless=False, stream_ids=None):
+        """
+        Run detection on several frames (e.g. newest frame of every camera)
+        with ONE model call. Returns a list of (annotated_frame, stats), same order as frames
+        (or (detections, stats) with headless=True, see detect()).
+        Frames whose stream is due for a skip (see latency_budget) don't go to the model.
         """
+        if not frames:
+            return []
+        if stream_ids is None:
+            stream_ids = [None] * len(frames)
+
         # --- NO LIBRARY INSTALLED ---
+        if self.model is None:
+            outputs = [([], {"total_people": 0, "violations": 0}) for _ in frames]
+        # -----------------------------
+        else:
+            interval = self.skip_interval(len(frames))
+            plan = [self._schedule(stream_id, frame, interval) for stream_id, frame in zip(stream_ids, frames)]
+            run_idx = [i for i, (action, _, _) in enumerate(plan) if action == 'infer']
+            outputs = [None] * len(frames)
+
+            if run_idx:
+                start = time.perf_counter()
+                with metrics.timer('inference'):
+                    results = self._infer([frames[i] for i in run_idx], [stream_ids[i] for i in run_idx])
+                self._record_inference_time((time.perf_counter() - start) / len(run_idx))
+
+                for i, result in zip(run_idx, results):
+                    state = self._stream_state(stream_ids[i]) if self.tracking else None
+                    with metrics.timer('postprocess'):
+                        outputs[i] = self._process_result(frames[i], result, state)
+                    self._remember(stream_ids[i], frames[i], outputs[i], plan[i][1])
+
+            for i, (action, _, state) in enumerate(plan):
+                if action == 'static':
+                    # Nothing moved: the last real detections are still valid as they are
+                    state.frames_since_inference += 1
+                    outputs[i] = (state.detections, state.stats)
+                    metrics.incr('inference_gated')
+                elif action == 'propagate':
+                    with metrics.timer('propagate'):
+                        outputs[i] = self._propagate(state, frames[i])
+                    metrics.incr('inference_skipped')
+
+        if headless:
+            return outputs
+        return [(self.annotate(frame, detections), stats) for frame, (detections, stats) in zip(frames, outputs)]
+
+    def _infer(self, frames, stream_ids):
+        """
+        One model call for all frames. Frames of streams with Zones (see zones.py / set_zones)
+        contribute their zone crops / tiles instead of the full frame; the tile results are
+        merged back into one result per frame in frame coordinates (cross-tile NMS).
+        """
+        images = []
+        parts = [] # per frame: None (full frame) or (zones, [(index in images, offset), ...])
+        for frame, stream_id in zip(frames, stream_ids):
+            zones = self.zones.get(stream_id)
+            if zones is None:
+                parts.append(None)
+                images.append(frame)
+                continue
+            crops = zones.crops(frame)
+            parts.append((zones, [(len(images) + k, offset) for k, (_, offset) in enumerate(crops)]))
+            images.extend(crop for crop, _ in crops)
+            metrics.incr('tiles', len(crops))
+
+        # Every frame may be zoned to nothing (full_frame=False, polygons clipped away)
+        results = self.model(images, verbose=False, conf=0.10, imgsz=self.imgsz) if images else []
+
+        merged = []
+        n = 0
+        for frame, frame_parts in zip(frames, parts):
+            if frame_parts is None:
+                merged.append(results[n])
+                n += 1
+                continue
+            zones, crops = frame_parts
+            data = merge_detections([(results[k].boxes.data, offset) for k, offset in crops])
+            data = data[zones.contains(frame.shape, data[:, :4])]
+            merged.append(inference.Result(self.model.names, data))
+            n += len(crops)
+        return merged
+
+    def set_zones(self, stream_id, zones):
+        """Restrict a stream to Zones (polygons / tiled inference), None = whole frame."""
+        if zones is None:
+            self.zones.pop(stream_id, None)
+        else:
+            self.zones[stream_id] = zones
+        self.reset_stream(stream_id)
+
+    # --- FRAME SKIPPING ---
+
+    def skip_interval(self, batch_size=1):
+        """Run the model every N frames per stream so one loop iteration fits the latency budget."""
+        if self.latency_budget is None or self.inference_time is None:
+            return 1
+        interval = int(np.ceil(self.inference_time * batch_size / self.latency_budget))
+        return max(1, min(self.max_skip, interval))
+
+    def _record_inference_time(self, seconds):
+        if self.inference_time is None:
+            self.inference_time = seconds
+        else:
+            self.inference_time = 0.9 * self.inference_time + 0.1 * seconds
+
+    def _schedule(self, stream_id, frame, interval):
+        """
+        Decide what to do with one frame of a stream. Returns (action, gate_thumb, state):
+          'infer'     - run the model
+          'static'    - motion gate: nothing changed since the last inference, reuse as-is
+          'propagate' - frame skipping: carry the last boxes forward
+        state is the StreamState the decision was made on. The batch keeps using it even if
+        reset_stream() drops it from another thread (API) meanwhile; the reset applies to the next batch.
+        """
+        if stream_id is None:
+            return 'infer', None, None
+
+        gate_thumb = self.motion_gate.thumbnail(frame) if self.motion_gate is not None else None
+        state = self.streams.get(stream_id)
+        if state is None or state.frames_since_inference is None:
+            return 'infer', gate_thumb, state
+
+        if gate_thumb is not None and self.motion_gate.is_static(state.gate_thumb, gate_thumb, state.last_inference_time):
+            return 'static', gate_thumb, state
+        if state.frames_since_inference + 1 >= interval:
+            return 'infer', gate_thumb, state
+        return 'propagate', gate_thumb, state
+
+    def reset_stream(self, stream_id):
+        """Forget carried-over detections (camera removed or switched to another source)."""
+        self.streams.pop(stream_id, None)
+
+    def _thumbnail(self, frame, width=320):
+        """Small grayscale float32 copy of the frame for cheap motion estimates."""
+        h, w = frame.shape[:2]
+        scale = min(1.0, width / float(w))
+        small = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.float32), scale
+
+    def _stream_state(self, stream_id):
+        if stream_id is None:
+            return None
+        state = self.streams.get(stream_id)
+        if state is None:
+            state = StreamState(self.track_window)
+            self.streams[stream_id] = state
+        return state
+
+    def _remember(self, stream_id, frame, output, gate_thumb=None):
+        state = self._stream_state(stream_id)
+        if state is None:
+            return
+        state.frames_since_inference = 0
+        state.detections, state.stats = output
+        state.gate_thumb = gate_thumb
+        state.last_inference_time = time.time()
+        state.reference_thumb = self._thumbnail(frame) if self.motion_compensation and self.latency_budget else None
+
+    def _propagate(self, state, frame):
+        """Carry the last detections of a stream (its StreamState) forward to a frame the model skipped."""
+        state.frames_since_inference += 1
+
+        if state.reference_thumb is None or not state.detections:
+            return state.detections, state.stats
+
+        ref, scale = state.reference_thumb
+        cur, _ = self._thumbnail(frame)
+        if cur.shape != ref.shape:
+            return state.detections, state.stats # resolution changed, don't guess
+
+        h, w = frame.shape[:2]
+        detections = []
+        for det in state.detections:
+            dx, dy = self._box_shift(ref, cur, det['box'], scale)
+            x1, y1, x2, y2 = det['box']
+            shifted = dict(det)
+            shifted['box'] = (int(np.clip(x1 + dx, 0, w)), int(np.clip(y1 + dy, 0, h)),
+                              int(np.clip(x2 + dx, 0, w)), int(np.clip(y2 + dy, 0, h)))
+            detections.append(shifted)
+        return detections, state.stats
+
+    def _box_shift(self, ref, cur, box, scale, min_size=8, min_response=0.1):
+        """
+        Estimate how far the content of one box moved between the reference and the
+        current thumbnail (phase correlation on a padded patch). Returns (dx, dy) in frame pixels.
+        """
+        x1, y1, x2, y2 = [int(v * scale) for v in box]
+        pad_x = max(4, (x2 - x1) // 4)
+        pad_y = max(4, (y2 - y1) // 4)
+        x1, y1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+        x2, y2 = min(ref.shape[1], x2 + pad_x), min(ref.shape[0], y2 + pad_y)
+        if x2 - x1 < min_size or y2 - y1 < min_size:
+            return 0.0, 0.0
+
+        (dx, dy), response = cv2.phaseCorrelate(ref[y1:y2, x1:x2], cur[y1:y2, x1:x2])
+        if response < min_response:
+            return 0.0, 0.0 # No reliable match (occlusion / lighting change)
+        return dx / scale, dy / scale
+
+    def annotate(self, frame, detections):
+        """
+        Draw the final detections (and only those) on a copy of the frame.
+        This is the only place that draws, so each frame is annotated exactly once.
+        """
+        with metrics.timer('annotate'):
+            return self._draw(frame, detections)
+
+    def _draw(self, frame, detections):
+        annotated_frame = frame.copy()
+
+        if self.model is None and not self.loaded:
+            cv2.putText(annotated_frame, "MODEL WARMING UP", (50, 50),
+                       cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 165, 255), 2)
+            return annotated_frame
+
         if self.model is None:
             # Just display a warning on the frame
-            cv2.putText(frame, "AI LIBRARIES MISSING", (50, 50), 
+            cv2.putText(annotated_frame, "AI LIBRARIES MISSING", (50, 50), 
                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-            cv2.putText(frame, "Please install requirements.txt", (50, 90), 
+            cv2.putText(annotated_frame, "Please install requirements.txt", (50, 90), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            return frame, {"total_people": 0, "violations": 0}
-        # -----------------------------
+            return annotated_frame
 
-        results = self.model(frame, verbose=False, conf=0.10)
-        result = results[0]
-
-        total_people = 0
-        violations = 0
-        
-        # Draw detections
-        annotated_frame = result.plot()
-        
-        # DEBUG: Print detected classes to terminal to verify what the model sees
-        if len(result.boxes) > 0:
-            print(f"Detections: {[int(b.cls[0]) for b in result.boxes]}")
-
-        
-        # Count statistics based on class names
-        # We check result.names for the actual class labels
-        names = result.names
-        # Custom Mapping for Safety Model (Orbit-xboi4)
-        # Since the model only returns IDs 0-4, we map them to standard safety classes.
-        # This is a best-guess based on standard PPE datasets.
-        # Adjust if labels are swapped (e.g. if 0 shows as 'No-Helmet' but is actually 'Helmet').
-        CLASS_MAP = {
-            0: 'Hardhat',
-            1: 'NO-Hardhat',
-            2: 'NO-Safety Vest',
-            3: 'Person',
-            4: 'Safety Vest',
-            5: 'Safety Gloves',
-            6: 'Safety Boot',
-            7: 'Safety Glasses',
-            8: 'Mask'
-        }
+        for det in detections:
+            x1, y1, x2, y2 = det['box']
+            label = f"{det['label']} {det['conf']:.2f}"
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), det['color'], 2)
+            cv2.putText(annotated_frame, label, (x1, y1-10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, det['color'], 2)
+        return annotated_frame
 
-        # Debug: Print what we found to console periodically
-        # print(names) 
-        
-        # Store valid detections to handle conflicts later
-        valid_detections = [] # list of (cls_id, conf, box, label, color)
-        
-        for box in result.boxes:
-            cls_id = int(box.cls[0])
-            conf = float(box.conf[0])
-            x1, y1, x2, y2 = box.xyxy[0]
-            x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-            
-            # --- 1. HARDHAT COLOR FILTER ---
-            # If detecting "Hardhat" (0), verify it is NOT hair (Black/Brown)
-            if cls_id == 0:
-                # Extract ROI
-                roi = frame[y1:y2, x1:x2]
-                if roi.size > 0:
-                    # Convert to HSV
-                    hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-                    # Check Brightness (Value)
-                    mean_val = np.mean(hsv[:, :, 2])
-                    # Hair is usually dark (Value < 60-80). Hardhats (White/Yellow) are bright (>100).
-                    # Red/Blue hardhats might be darker but still > hair.
-                    
-                    print(f"Hardhat Candidate Conf:{conf:.2f} Brightness:{mean_val:.1f}")
-                    
-                    if mean_val < 70: # Threshold for "Dark Object" (Hair)
-                        print("-> Rejected (Too Dark/Hair)")
-                        continue
-            
-            # --- 2. GEOMETRIC & CONFIDENCE FILTERS ---
-            if cls_id == 0:
-                 # Aspect Ratio Check: Hardhats are "Squarish" or "Wide". 
-                 # Human Heads/Faces are "Tall" (Rectangular).
-                 # If Height > 1.25 * Width, it's likely a Face/Head, not a Hat.
-                 width = x2 - x1
-                 height = y2 - y1
-                 aspect_ratio = height / width
-                 
-                 if aspect_ratio > 1.25:
-                     print(f"-> Rejected (Too Tall: AR {aspect_ratio:.2f})")
-                     continue
-
-                 if conf < 0.80: continue # Strict Confidence for Hardhat
-            
-            if cls_id in [5, 7, 8]:
-                print(f"Small PPE Candidate {cls_id}: {conf:.2f}") # Debug Gloves/Glasses/Masks
-                if conf < 0.10: continue # Lenient for Small PPE
-            
+    def _class_table(self, names):
+        """
+        Per-class lookup arrays (indexed by class ID) for labels, colors and the
+        substring rules used by the filters and stats. Built once per set of model names.
+        """
+        if self.class_table is not None and self.class_table_names == names:
+            return self.class_table
+
+        num_classes = max(list(names.keys()) + list(CLASS_MAP.keys())) + 1
+        raw_labels = []
+        for cls_id in range(num_classes):
             # Get Label name
             if cls_id in CLASS_MAP:
-                raw_label = CLASS_MAP[cls_id]
+                raw_labels.append(CLASS_MAP[cls_id])
             else:
-                raw_label = names[cls_id]
-                
-            label = f"{raw_label} {conf:.2f}"
-            
+                raw_labels.append(names.get(cls_id, str(cls_id)))
+        lower = [l.lower() for l in raw_labels]
+
+        def flag(rule):
+            return np.array([rule(l) for l in lower], dtype=bool)
+
+        colors = []
+        for l in lower:
             # Determine Color
-            color = (0, 0, 255) if 'no-' in label.lower() else (0, 255, 0)
-            if 'person' in label.lower(): color = (255, 255, 0)
-            if 'boot' in label.lower(): color = (255, 0, 255) # Magenta for boots
-            
-            valid_detections.append({
-                'id': cls_id,
-                'conf': conf,
-                'box': (x1, y1, x2, y2),
-                'label': label,
-                'color': color,
-                'raw_label': raw_label.lower()
-            })
+            color = (0, 0, 255) if 'no-' in l else (0, 255, 0)
+            if 'person' in l: color = (255, 255, 0)
+            if 'boot' in l: color = (255, 0, 255) # Magenta for boots
+            colors.append(color)
+
+        self.class_table = {
+            'raw_label': raw_labels,
+            'color': colors,
+            'person': flag(lambda l: 'person' in l),
+            # Explicit violations: "no-..." / "missing" / unprotected head
+            'violation': flag(lambda l: 'no-' in l or 'missing' in l or ('head' in l and 'hardhat' not in l)),
+            'hardhat': flag(lambda l: 'hardhat' in l and 'no-' not in l),
+            'vest': flag(lambda l: 'vest' in l and 'no-' not in l),
+            'no_hardhat': flag(lambda l: 'no-hardhat' in l),
+            'no_vest': flag(lambda l: 'no-safety vest' in l),
+            'any_vest': flag(lambda l: 'vest' in l),
+        }
+        self.class_table_names = dict(names)
+        return self.class_table
+
+    def _resolve_conflicts(self, boxes, conf, cls_ids, table):
+        """
+        Vest vs No-Vest: if conflicting classes overlap, keep the higher confidence one.
+        Returns a boolean mask of the detections to remove.
+        """
+        n = len(cls_ids)
+        removed = np.zeros(n, dtype=bool)
+        if n < 2:
+            return removed
+
+        any_vest = table['any_vest'][cls_ids]
+        no_vest = table['no_vest'][cls_ids]
+        conflict = (any_vest[:, None] & no_vest[None, :]) | (no_vest[:, None] & any_vest[None, :])
+        if not conflict.any():
+            return removed
+
+        # Simple overlap: do the boxes intersect at all? (intersection area > 0)
+        x1, y1, x2, y2 = boxes.T
+        overlap_w = np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :])
+        overlap_h = np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :])
+        pairs = np.triu(conflict & (overlap_w > 0) & (overlap_h > 0), k=1)
+
+        # Greedy pass in detection order, only over the pairs that actually conflict
+        for i in np.flatnonzero(pairs.any(axis=1)):
+            if removed[i]: continue
+            for j in np.flatnonzero(pairs[i]):
+                if removed[j]: continue
+                label_a = table['raw_label'][cls_ids[i]]
+                label_b = table['raw_label'][cls_ids[j]]
+                # Remove lower confidence
+                if conf[i] >= conf[j]:
+                    removed[j] = True
+                    metrics.log('conflict', f"Resolved Conflict: Kept {label_a.lower()}, Removed {label_b.lower()}")
+                else:
+                    removed[i] = True
+                    metrics.log('conflict', f"Resolved Conflict: Kept {label_b.lower()}, Removed {label_a.lower()}")
+                    break # Stop checking i, it's gone
+        return removed
+
+    def _process_result(self, frame, result, state=None):
+        """
+        Filter and count the raw model output for one frame.
+        Returns (detections, stats); detections is a list of
+        {'id', 'label', 'conf', 'box': (x1, y1, x2, y2), 'color'} dicts
+        (plus 'track_id' when a StreamState is given for tracking).
+        """
+        table = self._class_table(result.names)
+
+        # Pull all boxes out ONCE as an (N, 6) array: x1, y1, x2, y2, conf, cls
+        data = result.boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        data = np.asarray(data, dtype=np.float64).reshape(-1, 6)
+
+        cls_ids = data[:, 5].astype(np.int64)
+        conf = data[:, 4]
+        boxes = np.trunc(data[:, :4]).astype(np.int64) # same as int() on each coordinate
+        x1, y1, x2, y2 = boxes.T
+
+        # DEBUG: Print detected classes to terminal to verify what the model sees (sampled)
+        if len(cls_ids) > 0 and metrics.should_log('detections'):
+            print(f"Detections: {cls_ids.tolist()}")
+
+        keep = np.ones(len(cls_ids), dtype=bool)
+
+        # --- 1. GEOMETRIC & CONFIDENCE FILTERS ---
+        is_hardhat = cls_ids == 0
+        # Aspect Ratio Check: Hardhats are "Squarish" or "Wide". 
+        # Human Heads/Faces are "Tall" (Rectangular).
+        # If Height > 1.25 * Width, it's likely a Face/Head, not a Hat.
+        width = x2 - x1
+        height = y2 - y1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aspect_ratio = height / width
+        keep &= ~(is_hardhat & ((aspect_ratio > 1.25) | (width == 0)))
+        keep &= ~(is_hardhat & (conf < 0.80)) # Strict Confidence for Hardhat
+
+        # Lenient for Small PPE (Gloves/Glasses/Masks)
+        keep &= ~(np.isin(cls_ids, [5, 7, 8]) & (conf < 0.10))
+
+        # --- TRACKING ---
+        # Candidates that passed the cheap checks get persistent IDs, so the
+        # expensive per-object checks below can be cached on the track.
+        now = time.time()
+        tracks = {}
+        if state is not None:
+            candidates = np.flatnonzero(keep)
+            tracks = dict(zip(candidates.tolist(), state.tracker.update(cls_ids[candidates], boxes[candidates], now)))
+
+        # --- 2. HARDHAT COLOR FILTER ---
+        # If detecting "Hardhat" (0), verify it is NOT hair (Black/Brown).
+        # Only the candidates that passed the cheap checks above need the ROI.
+        to_check = []
+        for i in np.flatnonzero(keep & is_hardhat):
+            track = tracks.get(i)
+            if track is not None and track.verdict_is_fresh(now, self.verdict_interval):
+                keep[i] = track.verdict # Same object as a moment ago, reuse its verdict
+                metrics.incr('verdict_cache_hits')
+            else:
+                to_check.append(i)
+
+        if to_check:
+            is_hat = self._is_bright(frame, boxes[to_check], conf[to_check])
+            keep[to_check] = is_hat
+            for i, verdict in zip(to_check, is_hat):
+                if i in tracks:
+                    tracks[i].set_verdict(bool(verdict), now)
+
+        idx = np.flatnonzero(keep)
 
         # --- 3. CONFLICT RESOLUTION (Vest vs No-Vest) ---
-        # If we have conflicting classes overlapping, pick the higher confidence one.
-        indices_to_remove = set()
-        
-        for i in range(len(valid_detections)):
-            if i in indices_to_remove: continue
-            
-            det_a = valid_detections[i]
-            box_a = det_a['box']
-            label_a = det_a['raw_label']
-            
-            for j in range(i + 1, len(valid_detections)):
-                if j in indices_to_remove: continue
-                
-                det_b = valid_detections[j]
-                box_b = det_b['box']
-                label_b = det_b['raw_label']
-                
-                # Check conflict: Vest vs No-Vest
-                conflict = False
-                if ('vest' in label_a and 'no-safety vest' in label_b) or \
-                   ('vest' in label_b and 'no-safety vest' in label_a):
-                     conflict = True
-                     
-                if conflict:
-                    # Calculate IoU (Intersection over Union) or simple overlap
-                    # Simple overlap: do the boxes intersect significantly?
-                    xA = max(box_a[0], box_b[0])
-                    yA = max(box_a[1], box_b[1])
-                    xB = min(box_a[2], box_b[2])
-                    yB = min(box_a[3], box_b[3])
-                    
-                    interArea = max(0, xB - xA) * max(0, yB - yA)
-                    if interArea > 0: # They overlap
-                         # Remove lower confidence
-                         if det_a['conf'] >= det_b['conf']:
-                             indices_to_remove.add(j)
-                             print(f"Resolved Conflict: Kept {label_a}, Removed {label_b}")
-                         else:
-                             indices_to_remove.add(i)
-                             print(f"Resolved Conflict: Kept {label_b}, Removed {label_a}")
-                             break # Stop checking i, it's gone
-        
-        # --- DRAW FINAL DETECTIONS ---
-        detected_class_names = []
-        
-        for i, det in enumerate(valid_detections):
-            if i in indices_to_remove: continue
-            
-            x1, y1, x2, y2 = det['box']
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), det['color'], 2)
-            cv2.putText(annotated_frame, det['label'], (x1, y1-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, det['color'], 2)
-            
-            detected_class_names.append(det['raw_label'])
-        
+        removed = self._resolve_conflicts(boxes[idx], conf[idx], cls_ids[idx], table)
+        idx = idx[~removed]
+
+        # --- FINAL DETECTIONS ---
+        detections = [{
+            'id': int(cls_ids[i]),
+            'label': table['raw_label'][cls_ids[i]],
+            'conf': float(conf[i]),
+            'box': (int(x1[i]), int(y1[i]), int(x2[i]), int(y2[i])),
+            'color': table['color'][cls_ids[i]]
+        } for i in idx]
+        if state is not None:
+            for det, i in zip(detections, idx):
+                det['track_id'] = tracks[i].id
+
         # --- STATS LOGIC ---
-        
-        has_person = any('person' in l for l in detected_class_names)
-        
+        final_cls = cls_ids[idx]
+
+        # Calculate actual count of people
+        total_people = int(table['person'][final_cls].sum())
+        has_person = total_people > 0
+
         # Check Explicit Violations
-        for l in detected_class_names:
-            is_violation = False
-            if 'no-' in l or 'missing' in l: is_violation = True
-            # Unprotected parts checks
-            if 'head' in l and 'hardhat' not in l: is_violation = True 
-            
-            if is_violation:
-                # print(f"Explicit Violation: {l}")
-                violations += 1
-                
+        violations = int(table['violation'][final_cls].sum())
+
         # Check Implicit Violations (Person but missing items)
         # Requirement: Hardhat AND Vest
-        has_hardhat = any('hardhat' in l and 'no-' not in l for l in detected_class_names)
-        has_vest = any('vest' in l and 'no-' not in l for l in detected_class_names)
-        
+        has_hardhat = table['hardhat'][final_cls].any()
+        has_vest = table['vest'][final_cls].any()
+
         if has_person and (not has_hardhat or not has_vest):
-             if not has_hardhat and not any('no-hardhat' in l for l in detected_class_names):
-                 print("Implicit Violation: Missing Hardhat")
+             if not has_hardhat and not table['no_hardhat'][final_cls].any():
+                 metrics.log('implicit_hardhat', "Implicit Violation: Missing Hardhat")
                  violations += 1
                  
-             if not has_vest and not any('no-safety vest' in l for l in detected_class_names):
-                 print("Implicit Violation: Missing Vest")
+             if not has_vest and not table['no_vest'][final_cls].any():
+                 metrics.log('implicit_vest', "Implicit Violation: Missing Vest")
                  violations += 1
-        
-        # Normalize violations (boolean status usually preferred for UI)
-        if violations > 0:
-             # Ensure at least 1 count
-             pass
-
-        # Calculate actual count of people
-        total_people = sum(1 for l in detected_class_names if 'person' in l)
 
         stats = {
             "total_people": total_people,
             "violations": violations
         }
 
-        return annotated_frame, stats
+        if state is not None:
+            stats.update(self._track_stats(state, idx, cls_ids, boxes, table, tracks, now))
+
+        return detections, stats
+
+    def _is_bright(self, frame, boxes, conf):
+        """
+        Hardhat color filter for several boxes at once: False where the box is too dark
+        (most likely hair). Same rule as mean(HSV V) < 70 on each ROI, but the V channel
+        (= max(B, G, R)) is summed once per frame and each box is an O(1) lookup.
+        """
+        sums, areas = box_brightness_sums(frame, boxes)
+        # Hair is usually dark (Value < 60-80). Hardhats (White/Yellow) are bright (>100).
+        # Red/Blue hardhats might be darker but still > hair.
+        # mean < 70  <=>  sum < 70 * area (exact, integers). Empty ROIs are not rejected.
+        is_hat = (areas == 0) | (sums >= 70 * areas)
+
+        if not is_hat.all() and metrics.should_log('hardhat_rejected'):
+            i = int(np.flatnonzero(~is_hat)[0])
+            print(f"Hardhat Candidate Conf:{conf[i]:.2f} Brightness:{sums[i] / areas[i]:.1f} -> Rejected (Too Dark/Hair)")
+        return is_hat
+
+    def _track_stats(self, state, idx, cls_ids, boxes, table, tracks, now):
+        """
+        Per-person PPE verdicts (cached on the person's track) and unique
+        people / violations over the last track_window seconds.
+        """
+        final_cls = cls_ids[idx]
+        final_boxes = boxes[idx]
+        person_idx = idx[table['person'][final_cls]]
+        explicit_idx = idx[table['violation'][final_cls]]
+        hats = final_boxes[table['hardhat'][final_cls]]
+        vests = final_boxes[table['vest'][final_cls]]
+        explicit = boxes[explicit_idx]
+
+        # Only re-check people whose verdict is stale
+        stale = [i for i in person_idx if not tracks[i].verdict_is_fresh(now, self.verdict_interval)]
+        if stale:
+            verdicts = person_violations(boxes[stale], hats, vests, explicit)
+            for i, violating in zip(stale, verdicts):
+                tracks[i].set_verdict(bool(violating), now)
+            metrics.incr('person_verdicts', len(stale))
+
+        for i in person_idx:
+            state.people.add(tracks[i].id, now)
+            if tracks[i].verdict:
+                state.violators.add(tracks[i].id, now)
+
+        # Explicit violations (e.g. NO-Hardhat) without a person box around them count on their own
+        if len(explicit_idx):
+            inside = boxes_contain_centers(boxes[person_idx], explicit).any(axis=0)
+            for i in explicit_idx[~inside]:
+                state.violators.add(('explicit', tracks[i].id), now)
+
+        return {
+            "unique_people": state.people.count(now),
+            "unique_violations": state.violators.count(now),
+            "window_s": self.track_window
+        }
@@ -0,0 +1,246 @@
+import ast
+import os
+import time
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import openvino as ov
+except ImportError:
+    ov = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# 'torch' = ultralytics/PyTorch (.pt), the others run an exported model on the CPU
+BACKENDS = ('torch', 'onnx', 'openvino')
+# Candidates passed to NMS at most (highest scores first), same cap as ultralytics' max_nms
+MAX_NMS = 30000
+
+class Boxes:
+    """Same layout as ultralytics' Boxes.data: (N, 6) x1, y1, x2, y2, conf, cls in frame pixels."""
+    def __init__(self, data):
+        self.data = data
+
+class Result:
+    """Minimal stand-in for an ultralytics Results object (all PPE_Detector._process_result needs)."""
+    def __init__(self, names, data):
+        self.names = names
+        self.boxes = Boxes(data)
+
+def letterbox(frame, size, color=(114, 114, 114)):
+    """
+    Resize keeping the aspect ratio and pad to size x size (like ultralytics' LetterBox).
+    Returns (image, gain, (pad_x, pad_y)).
+    """
+    h, w = frame.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    if (new_w, new_h) != (w, h):
+        frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    image = cv2.copyMakeBorder(frame, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return image, gain, (left, top)
+
+def decode_output(output, frame_shape, gain, pad, conf=0.25, iou=0.7, max_det=300):
+    """
+    Raw YOLOv8 detection head output for one image, (4 + num_classes, anchors) with
+    cx, cy, w, h in letterboxed pixels, -> (N, 6) boxes in frame pixels after per-class NMS.
+    """
+    output = np.asarray(output, dtype=np.float32)
+    scores = output[4:]
+    cls_ids = scores.argmax(axis=0)
+    best = scores[cls_ids, np.arange(scores.shape[1])]
+    keep = best > conf
+    if not keep.any():
+        return np.zeros((0, 6), dtype=np.float32)
+
+    cx, cy, w, h = output[:4, keep]
+    best, cls_ids = best[keep], cls_ids[keep]
+    if len(best) > MAX_NMS:
+        top = np.argsort(-best, kind='stable')[:MAX_NMS]
+        cx, cy, w, h, best, cls_ids = cx[top], cy[top], w[top], h[top], best[top], cls_ids[top]
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # Class-aware NMS in one call: boxes of different classes are offset so they never overlap
+    offset = cls_ids[:, None].astype(np.float32) * 7680
+    shifted = boxes + offset
+    rects = np.concatenate([shifted[:, :2], shifted[:, 2:] - shifted[:, :2]], axis=1)
+    # No top_k: limiting to max_det before NMS would let duplicates of one object crowd out the others
+    idx = cv2.dnn.NMSBoxes(rects.tolist(), best.tolist(), conf, iou)
+    idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+    # Highest score first, like ultralytics
+    idx = idx[np.argsort(-best[idx], kind='stable')][:max_det]
+
+    boxes = boxes[idx]
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= gain
+    height, width = frame_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return np.concatenate([boxes, best[idx, None], cls_ids[idx, None].astype(np.float32)], axis=1)
+
+def parse_names(value):
+    """Class names from export metadata ("{0: 'Hardhat', ...}" string or dict)."""
+    if isinstance(value, str):
+        value = ast.literal_eval(value)
+    return {int(k): v for k, v in value.items()}
+
+class ExportedModel:
+    """
+    Exported YOLOv8 detector. Pre-processing (letterbox) and post-processing (decode + NMS)
+    are shared, subclasses only run the network. Called like an ultralytics model:
+    model(frames, conf=0.10) -> list of Result.
+    """
+    def __init__(self, names, imgsz=640, iou=0.7, max_det=300):
+        self.names = names
+        self.imgsz = imgsz
+        self.iou = iou
+        self.max_det = max_det
+        self.fixed_batch = None   # set by subclasses when the model only takes N images per call
+
+    def __call__(self, frames, verbose=False, conf=0.25, **kwargs):
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        prepared = [letterbox(frame, self.imgsz) for frame in frames]
+        images = np.stack([image for image, _, _ in prepared])
+        # BGR HWC uint8 -> RGB NCHW float32 0..1
+        blob = np.ascontiguousarray(images[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+
+        if self.fixed_batch:
+            outputs = np.concatenate([self._run(blob[i:i + self.fixed_batch])
+                                      for i in range(0, len(blob), self.fixed_batch)])
+        else:
+            outputs = self._run(blob)
+
+        return [Result(self.names, decode_output(output, frame.shape, gain, pad, conf, self.iou, self.max_det))
+                for output, frame, (_, gain, pad) in zip(outputs, frames, prepared)]
+
+    def _run(self, blob):
+        raise NotImplementedError
+
+class OnnxModel(ExportedModel):
+    def __init__(self, path, imgsz=640, threads=None):
+        if ort is None:
+            raise ImportError("'onnxruntime' not found (pip install onnxruntime)")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+        meta = self.session.get_modelmeta().custom_metadata_map
+        shape = self.session.get_inputs()[0].shape
+        if isinstance(shape[2], int):
+            imgsz = shape[2] # static export: the input size is baked in
+        super().__init__(parse_names(meta['names']) if 'names' in meta else {}, imgsz)
+        if isinstance(shape[0], int):
+            self.fixed_batch = shape[0]
+
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVinoModel(ExportedModel):
+    def __init__(self, path, imgsz=640, threads=None):
+        if ov is None:
+            raise ImportError("'openvino' not found (pip install openvino)")
+        if os.path.isdir(path):
+            path = next(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.xml'))
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            config['INFERENCE_NUM_THREADS'] = threads
+        core = ov.Core()
+        network = core.read_model(path)
+        self.compiled = core.compile_model(network, 'CPU', config)
+
+        names = {}
+        metadata = os.path.join(os.path.dirname(path), 'metadata.yaml')
+        if yaml is not None and os.path.exists(metadata):
+            with open(metadata) as f:
+                names = parse_names(yaml.safe_load(f).get('names', {}))
+        shape = network.inputs[0].get_partial_shape()
+        if shape[2].is_static:
+            imgsz = shape[2].get_length()
+        super().__init__(names, imgsz)
+        if shape[0].is_static:
+            self.fixed_batch = shape[0].get_length()
+
+    def _run(self, blob):
+        return self.compiled(blob)[self.compiled.output(0)]
+
+def exported_path(model_path, backend, int8=False):
+    """Where the export of model_path for this backend lives (same naming as ultralytics)."""
+    base = os.path.splitext(model_path)[0]
+    if backend == 'onnx':
+        return f"{base}.int8.onnx" if int8 else f"{base}.onnx"
+    return f"{base}_int8_openvino_model" if int8 else f"{base}_openvino_model"
+
+def export_model(model_path, backend, imgsz=640, int8=False):
+    """
+    Export a .pt model for a CPU backend (needs ultralytics + torch, run it once on a dev machine
+    and copy the result to the edge box). INT8:
+      - openvino: post-training quantization by ultralytics/NNCF (calibrates on its default dataset)
+      - onnx: dynamic quantization of the weights with onnxruntime
+    """
+    from ultralytics import YOLO
+    target = exported_path(model_path, backend, int8)
+    if backend == 'onnx':
+        fp32 = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+        if not int8:
+            return fp32
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(fp32, target, weight_type=QuantType.QUInt8)
+        return target
+    return YOLO(model_path).export(format='openvino', imgsz=imgsz, int8=int8)
+
+def load_model(model_path='best.pt', backend='torch', imgsz=640, int8=False, threads=None):
+    """
+    Load the detector for a backend. For onnx/openvino, model_path can be the exported model
+    itself or the .pt it was exported from (the export is reused if present, created otherwise).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == 'torch':
+        from ultralytics import YOLO
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return YOLO(model_path)
+
+    if model_path.endswith('.pt'):
+        path = exported_path(model_path, backend, int8)
+        if not os.path.exists(path):
+            print(f"Exporting {model_path} to {path}...")
+            path = export_model(model_path, backend, imgsz, int8)
+    else:
+        path = model_path
+
+    if backend == 'onnx':
+        return OnnxModel(path, imgsz, threads)
+    return OpenVinoModel(path, imgsz, threads)
+
+def warm_up(model, imgsz=640, runs=2):
+    """
+    Run the model on blank frames so lazy initialization (memory arenas, kernel selection,
+    first-call JIT) happens now and not on the first camera frame. Returns seconds of the last run.
+    """
+    frame = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    elapsed = 0.0
+    for _ in range(runs):
+        start = time.perf_counter()
+        model([frame], verbose=False, conf=0.25, imgsz=imgsz)
+        elapsed = time.perf_counter() - start
+    return elapsed
@@ -0,0 +1,157 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Upper bounds (ms) of the latency histogram buckets. Anything slower goes to "+Inf".
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class Metrics:
+    """
+    Lightweight in-process instrumentation for the streaming hot path:
+      - per-stage latency histograms (capture, inference, postprocess, annotate, encode)
+      - counters (frames processed, frames dropped, errors, ...)
+      - rates (FPS) over a sliding window
+      - rate-limited debug logging, so print() never floods stdout under load
+    Everything is exposed as one JSON-friendly dict via snapshot() (/api/metrics).
+    """
+    def __init__(self, recent_samples=512, rate_window=5.0, log_interval=5.0):
+        self.lock = threading.Lock()
+        self.recent_samples = recent_samples
+        self.rate_window = rate_window
+        self.log_interval = log_interval
+        self.started = time.time()
+
+        self.histograms = {}   # stage -> {"buckets": [...], "count", "sum", "max"}
+        self.recent = {}       # stage -> deque of the last N durations (ms), for percentiles
+        self.counters = {}     # name -> int
+        self.events = {}       # name -> deque of event timestamps, for rates
+        self.log_last = {}     # key -> last time a message with this key was printed
+        self.log_suppressed = {} # key -> messages skipped since then
+
+    # --- Timing ---
+
+    def observe(self, stage, seconds):
+        """Record one duration (in seconds) for a pipeline stage."""
+        ms = seconds * 1000.0
+        with self.lock:
+            hist = self.histograms.get(stage)
+            if hist is None:
+                hist = {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+                self.histograms[stage] = hist
+                self.recent[stage] = deque(maxlen=self.recent_samples)
+
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if ms <= bound:
+                    hist["buckets"][i] += 1
+                    break
+            else:
+                hist["buckets"][-1] += 1
+            hist["count"] += 1
+            hist["sum"] += ms
+            hist["max"] = max(hist["max"], ms)
+            self.recent[stage].append(ms)
+
+    @contextmanager
+    def timer(self, stage):
+        """with metrics.timer('inference'): ..."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    # --- Counters & rates ---
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def tick(self, name):
+        """Count an event and include it in the per-second rate of `name` (e.g. FPS)."""
+        now = time.time()
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            events = self.events.get(name)
+            if events is None:
+                events = deque()
+                self.events[name] = events
+            events.append(now)
+            while events and now - events[0] > self.rate_window:
+                events.popleft()
+
+    # --- Logging ---
+
+    def should_log(self, key, interval=None):
+        """
+        True at most once per `interval` seconds for each key.
+        Use it to guard debug print()s in the hot path so the message isn't even built
+        when it would be dropped.
+        """
+        interval = self.log_interval if interval is None else interval
+        now = time.time()
+        with self.lock:
+            if now - self.log_last.get(key, 0) < interval:
+                self.log_suppressed[key] = self.log_suppressed.get(key, 0) + 1
+                return False
+            self.log_last[key] = now
+            return True
+
+    def log(self, key, message, interval=None):
+        """Rate-limited print(). Reports how many messages with the same key were skipped."""
+        if not self.should_log(key, interval):
+            return
+        with self.lock:
+            suppressed = self.log_suppressed.pop(key, 0)
+        if suppressed:
+            message = f"{message} (+{suppressed} similar suppressed)"
+        print(message)
+
+    # --- Export ---
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            stages = {}
+            for stage, hist in self.histograms.items():
+                recent = sorted(self.recent[stage])
+                stages[stage] = {
+                    "count": hist["count"],
+                    "avg_ms": round(hist["sum"] / hist["count"], 3),
+                    "max_ms": round(hist["max"], 3),
+                    "p50_ms": round(_percentile(recent, 50), 3),
+                    "p95_ms": round(_percentile(recent, 95), 3),
+                    "p99_ms": round(_percentile(recent, 99), 3),
+                    "buckets_ms": dict(zip([str(b) for b in LATENCY_BUCKETS_MS] + ["+Inf"], hist["buckets"]))
+                }
+
+            rates = {}
+            for name, events in self.events.items():
+                recent = [t for t in events if now - t <= self.rate_window]
+                rates[name] = round(len(recent) / self.rate_window, 2)
+
+            return {
+                "uptime_s": round(now - self.started, 1),
+                "stages": stages,
+                "counters": dict(self.counters),
+                "rates_per_s": rates,
+                "logs_suppressed": dict(self.log_suppressed)
+            }
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.recent.clear()
+            self.counters.clear()
+            self.events.clear()
+            self.log_suppressed.clear()
+            self.started = time.time()
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+# Shared instance used by camera.py, detector.py and app.py
+metrics = Metrics()
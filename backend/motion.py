@@ -0,0 +1,39 @@
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """
+    Cheap "did anything change?" test in front of the detector.
+    Compares a tiny blurred grayscale thumbnail of the current frame with the one
+    of the last frame that went through YOLO. If (almost) no pixels changed, the
+    previous detections/stats are still valid and the model call can be skipped.
+    A refresh is forced every refresh_interval seconds anyway.
+    """
+    def __init__(self, width=64, pixel_threshold=25, area_threshold=0.005, refresh_interval=5.0):
+        self.width = width                       # thumbnail width (px)
+        self.pixel_threshold = pixel_threshold   # gray level change that counts as "changed"
+        self.area_threshold = area_threshold     # fraction of changed pixels that counts as motion
+        self.refresh_interval = refresh_interval # seconds, force a real detection at least this often
+
+    def thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / float(w)))
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Blur away sensor noise / JPEG artifacts of the ESP32 stream
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def motion_ratio(self, reference, thumb):
+        """Fraction of thumbnail pixels that changed by more than pixel_threshold."""
+        diff = cv2.absdiff(reference, thumb)
+        return np.count_nonzero(diff > self.pixel_threshold) / float(diff.size)
+
+    def is_static(self, reference, thumb, last_refresh):
+        """True if the detections computed on `reference` can be reused for `thumb`."""
+        if reference is None or reference.shape != thumb.shape:
+            return False
+        if time.time() - last_refresh >= self.refresh_interval:
+            return False
+        return self.motion_ratio(reference, thumb) <= self.area_threshold
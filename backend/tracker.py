@@ -0,0 +1,124 @@
+import time
+import numpy as np
+
+def box_iou(a, b):
+    """IoU matrix between (N, 4) and (M, 4) arrays of x1, y1, x2, y2 boxes."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    inter_w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, inter / union, 0.0)
+
+class Track:
+    def __init__(self, track_id, cls_id, box, now):
+        self.id = track_id
+        self.cls_id = cls_id
+        self.box = box
+        self.hits = 1
+        self.misses = 0          # consecutive updates without a matching detection
+        self.first_seen = now
+        self.last_seen = now
+        self.verdict = None      # cached classification result (hair filter / PPE check)
+        self.verdict_time = 0.0
+
+    def verdict_is_fresh(self, now, max_age):
+        return self.verdict is not None and now - self.verdict_time < max_age
+
+    def set_verdict(self, verdict, now):
+        self.verdict = verdict
+        self.verdict_time = now
+
+class IoUTracker:
+    """
+    Minimal tracker that gives detections persistent IDs across frames.
+    Detections are matched to tracks of the same class by IoU, falling back to
+    centroid distance (relative to the box size) for small/fast objects.
+    """
+    def __init__(self, iou_threshold=0.3, centroid_threshold=0.5, max_misses=15):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_misses = max_misses
+        self.tracks = {}   # track_id -> Track
+        self.next_id = 1
+
+    def update(self, cls_ids, boxes, now=None):
+        """
+        Associate the detections of one frame with existing tracks.
+        Returns a list with the Track of each detection (same order as the input).
+        """
+        now = time.time() if now is None else now
+        cls_ids = np.asarray(cls_ids, dtype=np.int64).reshape(-1)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        tracks = list(self.tracks.values())
+        assigned = [None] * len(cls_ids)
+
+        if tracks and len(cls_ids):
+            track_boxes = np.array([t.box for t in tracks], dtype=np.float64)
+            track_cls = np.array([t.cls_id for t in tracks], dtype=np.int64)
+
+            iou = box_iou(track_boxes, boxes)
+            track_centers = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+            centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+            dist = np.linalg.norm(track_centers[:, None, :] - centers[None, :, :], axis=2)
+            size = np.maximum(track_boxes[:, 2] - track_boxes[:, 0], track_boxes[:, 3] - track_boxes[:, 1])
+            rel_dist = dist / np.maximum(size, 1.0)[:, None]
+
+            # IoU matches always win over centroid-only matches
+            score = np.where(iou >= self.iou_threshold, 1.0 + iou,
+                             np.where(rel_dist < self.centroid_threshold, 1.0 - rel_dist, 0.0))
+            score[track_cls[:, None] != cls_ids[None, :]] = 0.0
+
+            # Greedy assignment, best pairs first
+            used_tracks = set()
+            for flat in np.argsort(-score, axis=None):
+                t, d = divmod(int(flat), len(cls_ids))
+                if score[t, d] <= 0:
+                    break
+                if t in used_tracks or assigned[d] is not None:
+                    continue
+                used_tracks.add(t)
+                track = tracks[t]
+                track.box = tuple(boxes[d])
+                track.hits += 1
+                track.misses = 0
+                track.last_seen = now
+                assigned[d] = track
+
+        # Unmatched detections start new tracks
+        for d in range(len(cls_ids)):
+            if assigned[d] is None:
+                track = Track(self.next_id, int(cls_ids[d]), tuple(boxes[d]), now)
+                self.tracks[track.id] = track
+                self.next_id += 1
+                assigned[d] = track
+
+        # Age out tracks that weren't seen
+        matched = set(id(t) for t in assigned)
+        for track in tracks:
+            if id(track) not in matched:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    del self.tracks[track.id]
+
+        return assigned
+
+class UniqueCounter:
+    """Number of distinct IDs seen during the last `window` seconds."""
+    def __init__(self, window=60.0):
+        self.window = window
+        self.last_seen = {}  # key -> timestamp
+
+    def add(self, key, now=None):
+        self.last_seen[key] = time.time() if now is None else now
+
+    def count(self, now=None):
+        now = time.time() if now is None else now
+        expired = [k for k, t in self.last_seen.items() if now - t > self.window]
+        for k in expired:
+            del self.last_seen[k]
+        return len(self.last_seen)
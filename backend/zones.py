@@ -0,0 +1,162 @@
+import cv2
+import numpy as np
+
+MIN_TILE_SIZE = 32
+MAX_OVERLAP = 0.9 # tile step = tile_size * (1 - overlap), more overlap multiplies the number of tiles
+
+def _parse_bool(value, name):
+    """Strict bool parsing for JSON input: "false" / "0" must not count as True."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('true', '1', 'yes', 'false', '0', 'no'):
+        return value.strip().lower() in ('true', '1', 'yes')
+    raise ValueError(f"{name} must be true or false, got {value!r}")
+
+class Zones:
+    """
+    Region of interest of one camera for the detector.
+    polygons: list of polygons in normalized coordinates ([[x, y], ...] with 0..1 = frame width/height),
+              None/empty = whole frame. Pixels outside the polygons are never sent to the model and
+              detections whose center lies outside are dropped.
+    tile_size: if set, the region is cut into overlapping tile_size x tile_size tiles that go to the
+               model at (close to) full resolution, so small PPE (gloves, glasses, masks) stays visible.
+               full_frame adds one pass over the whole region for large objects (people) that span tiles.
+    Raises ValueError for settings that would make degenerate or huge numbers of tiles
+    (tile_size < MIN_TILE_SIZE, overlap outside [0, MAX_OVERLAP]) and for invalid polygons.
+    """
+    def __init__(self, polygons=None, tile_size=None, overlap=0.2, full_frame=True):
+        self.polygons = []
+        for polygon in polygons or []:
+            points = np.asarray(polygon, dtype=np.float64)
+            if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                raise ValueError("each polygon needs at least 3 [x, y] points")
+            if not np.isfinite(points).all() or points.min() < 0 or points.max() > 1:
+                raise ValueError("polygon points must be fractions of the frame size (0..1)")
+            self.polygons.append(points)
+
+        self.tile_size = None
+        if tile_size is not None:
+            self.tile_size = int(tile_size)
+            if self.tile_size < MIN_TILE_SIZE:
+                raise ValueError(f"tile_size must be at least {MIN_TILE_SIZE}")
+        self.overlap = float(overlap)
+        if not 0 <= self.overlap <= MAX_OVERLAP:
+            raise ValueError(f"overlap must be between 0 and {MAX_OVERLAP}")
+        self.full_frame = _parse_bool(full_frame, "full_frame")
+        self.cache_shape = None  # frame shape the cached mask / windows below were built for
+        self.cache = None
+
+    def to_dict(self):
+        return {
+            "polygons": [p.tolist() for p in self.polygons],
+            "tile_size": self.tile_size,
+            "overlap": self.overlap,
+            "full_frame": self.full_frame
+        }
+
+    def _layout(self, shape):
+        """(mask, windows) for a frame shape, built once per resolution."""
+        if self.cache_shape == shape[:2]:
+            return self.cache
+        h, w = shape[:2]
+        mask = None
+        x1, y1, x2, y2 = 0, 0, w, h
+        if self.polygons:
+            mask = np.zeros((h, w), dtype=np.uint8)
+            points = [np.round(p * (w, h)).astype(np.int32) for p in self.polygons]
+            cv2.fillPoly(mask, points, 255)
+            ys, xs = np.nonzero(mask)
+            if len(xs):
+                x1, y1, x2, y2 = int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1
+
+        region = (x1, y1, x2, y2)
+        windows = [region]
+        if self.tile_size is not None:
+            tiles = []
+            for ty1, ty2 in _tile_ranges(y1, y2, self.tile_size, self.overlap):
+                for tx1, tx2 in _tile_ranges(x1, x2, self.tile_size, self.overlap):
+                    # Tiles that only see masked-out pixels (walls, ceiling) are skipped
+                    if mask is None or mask[ty1:ty2, tx1:tx2].any():
+                        tiles.append((tx1, ty1, tx2, ty2))
+            if tiles != [region]: # else the region fits in a single tile anyway
+                windows = ([region] if self.full_frame else []) + tiles
+
+        self.cache_shape = shape[:2]
+        self.cache = (mask, windows)
+        return self.cache
+
+    def crops(self, frame):
+        """List of (image, (x_offset, y_offset)) to send to the model for this frame."""
+        mask, windows = self._layout(frame.shape)
+        crops = []
+        for x1, y1, x2, y2 in windows:
+            crop = frame[y1:y2, x1:x2]
+            if mask is not None:
+                crop = cv2.bitwise_and(crop, crop, mask=mask[y1:y2, x1:x2])
+            crops.append((crop, (x1, y1)))
+        return crops
+
+    def contains(self, frame_shape, boxes):
+        """(N,) bool: is the center of each (x1, y1, x2, y2) box inside the zones?"""
+        mask, _ = self._layout(frame_shape)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if mask is None:
+            return np.ones(len(boxes), dtype=bool)
+        h, w = mask.shape
+        cx = np.clip(((boxes[:, 0] + boxes[:, 2]) / 2).astype(np.int64), 0, w - 1)
+        cy = np.clip(((boxes[:, 1] + boxes[:, 3]) / 2).astype(np.int64), 0, h - 1)
+        return mask[cy, cx] > 0
+
+def _tile_ranges(start, stop, size, overlap):
+    """Start/stop pairs of overlapping tiles covering [start, stop), the last one aligned to stop."""
+    if stop - start <= size:
+        return [(start, stop)]
+    step = max(1, int(size * (1 - overlap)))
+    starts = list(range(start, stop - size, step)) + [stop - size]
+    return [(s, s + size) for s in starts]
+
+def merge_detections(parts, iou_threshold=0.5, ios_threshold=0.7):
+    """
+    Cross-tile NMS. parts: list of ((N, 6) x1, y1, x2, y2, conf, cls arrays, (x_offset, y_offset)).
+    Boxes are moved to frame coordinates, then a box is suppressed by a higher-scoring box of the same
+    class from another window if they overlap by IoU >= iou_threshold, or if it mostly lies inside
+    it (intersection over the smaller box >= ios_threshold) - the half-object a tile border cuts off.
+    Boxes of the same window were already NMSed by the model and are left alone, so a person partly
+    hidden behind another counts the same as without zones.
+    """
+    shifted, windows = [], []
+    for window, (data, (dx, dy)) in enumerate(parts):
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        data = np.array(data, dtype=np.float64).reshape(-1, 6)
+        data[:, [0, 2]] += dx
+        data[:, [1, 3]] += dy
+        shifted.append(data)
+        windows.append(np.full(len(data), window))
+    data = np.concatenate(shifted) if shifted else np.zeros((0, 6))
+    if len(parts) < 2 or len(data) < 2:
+        return data
+
+    order = np.argsort(-data[:, 4], kind='stable')
+    data, window = data[order], np.concatenate(windows)[order]
+    x1, y1, x2, y2 = data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    suppressed = np.zeros(len(data), dtype=bool)
+    for i in range(len(data)):
+        if suppressed[i]:
+            continue
+        rest = np.arange(i + 1, len(data))
+        rest = rest[~suppressed[rest] & (data[rest, 5] == data[i, 5]) & (window[rest] != window[i])]
+        if not len(rest):
+            continue
+        inter = (np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None) *
+                 np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None))
+        union = areas[i] + areas[rest] - inter
+        smaller = np.minimum(areas[i], areas[rest])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iou = np.where(union > 0, inter / union, 0.0)
+            ios = np.where(smaller > 0, inter / smaller, 0.0)
+        suppressed[rest[(iou >= iou_threshold) | (ios >= ios_threshold)]] = True
+    return data[~suppressed]
@@ -1,7 +1,7 @@
 
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable, interval } from 'rxjs';
+import { Observable, Subscription, interval } from 'rxjs';
 import { switchMap, retry } from 'rxjs/operators';
 import * as signalR from '@microsoft/signalr';
 
@@ -15,6 +15,9 @@ interface BackendStats {
 })
 export class SensorService {
     private apiUrl = 'http://localhost:5000/api/status';
+    private streamUrl = 'http://localhost:5000/api/stream';
+    private statsSource: EventSource | null = null;
+    private pollSubscription: Subscription | null = null;
     private hubUrl = 'http://localhost:5005/hubs/factory';
     private hubConnection: signalR.HubConnection | null = null;
 
@@ -34,15 +37,42 @@ export class SensorService {
 
     start(): void {
         this.startHubConnection();
-        // Optionally keep polling Flask backend for totalPeople/violations
-        interval(1000).pipe(
+        // Flask backend pushes totalPeople/violations only when they change (Server-Sent Events)
+        if (typeof EventSource !== 'undefined') {
+            this.startStatsStream();
+        } else {
+            this.startPolling();
+        }
+    }
+
+    private applyStats(stats: BackendStats): void {
+        this.totalPeople = stats.total_people;
+        this.violations = stats.violations;
+    }
+
+    private startStatsStream(): void {
+        this.statsSource = new EventSource(this.streamUrl);
+        this.statsSource.addEventListener('stats', (event: MessageEvent) => {
+            this.applyStats(JSON.parse(event.data));
+        });
+        this.statsSource.onerror = () => {
+            // EventSource reconnects by itself; only fall back to polling if it gave up
+            if (this.statsSource && this.statsSource.readyState === EventSource.CLOSED) {
+                this.statsSource = null;
+                this.startPolling();
+            }
+        };
+    }
+
+    private startPolling(): void {
+        if (this.pollSubscription) {
+            return;
+        }
+        this.pollSubscription = interval(1000).pipe(
             switchMap(() => this.http.get<BackendStats>(this.apiUrl)),
             retry(3)
         ).subscribe({
-            next: (stats) => {
-                this.totalPeople = stats.total_people;
-                this.violations = stats.violations;
-            },
+            next: (stats) => this.applyStats(stats),
             error: (err) => {
                 // Only log error, don't set connectionStatus here
                 console.error('Polling error:', err);
@@ -1,55 +1,93 @@
 import os
-import hashlib
+import json
 from glob import glob
 from tqdm import tqdm
 
+from hash_index import HashIndex, near_duplicate_groups, hamming
+
 DATASET_DIR = r"C:\Users\anasf\Documents\SmartFactory\dataset"
+SPLITS = ['train', 'valid', 'test']
+
+# Near-duplicates: same frame re-encoded / resized by another export.
+# Max differing bits (of 64) between perceptual hashes to count as the same image.
+NEAR_DUPLICATE_DISTANCE = 6
+# False = only report them (near_duplicates.json), True = delete all but the first copy
+REMOVE_NEAR_DUPLICATES = False
+WORKERS = None # hashing processes, None = all cores
+
+def label_path_for(img_path):
+    lbl_dir = os.path.join(os.path.dirname(os.path.dirname(img_path)), 'labels')
+    base_name = os.path.splitext(os.path.basename(img_path))[0]
+    return os.path.join(lbl_dir, base_name + ".txt")
+
+def remove_image(img_path, index):
+    os.remove(img_path)
+    index.remove(img_path)
+    lbl_path = label_path_for(img_path)
+    if os.path.exists(lbl_path):
+        os.remove(lbl_path)
 
-def get_hash(filepath):
-    """Returns MD5 hash of file content."""
-    with open(filepath, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+def split_of(img_path):
+    return os.path.basename(os.path.dirname(os.path.dirname(img_path)))
 
 def clean_duplicates():
     print(f"Scanning for duplicates in {DATASET_DIR}...")
-    
-    duplicates_found = 0
-    total_files = 0
-    unique_hashes = set()
-    
-    for split in ['train', 'valid', 'test']:
+
+    # Get all images, train first: the copy in the earlier split is the one we keep
+    image_files = []
+    for split in SPLITS:
         img_dir = os.path.join(DATASET_DIR, split, 'images')
-        lbl_dir = os.path.join(DATASET_DIR, split, 'labels')
-        
         if not os.path.exists(img_dir): continue
-        
-        # Get all images
-        image_files = sorted(glob(os.path.join(img_dir, "*.*")))
-        
-        for img_path in tqdm(image_files, desc=f"Cleaning {split}"):
-            file_hash = get_hash(img_path)
-            
-            if file_hash in unique_hashes:
-                # DUPLICATE FOUND
-                duplicates_found += 1
-                
-                # Delete Image
-                os.remove(img_path)
-                
-                # Delete Label
-                base_name = os.path.splitext(os.path.basename(img_path))[0]
-                lbl_path = os.path.join(lbl_dir, base_name + ".txt")
-                if os.path.exists(lbl_path):
-                    os.remove(lbl_path)
-                    
-                # print(f"Removed Duplicate: {os.path.basename(img_path)}")
-            else:
-                unique_hashes.add(file_hash)
-                total_files += 1
+        image_files.extend(sorted(glob(os.path.join(img_dir, "*.*"))))
+
+    index = HashIndex(DATASET_DIR, workers=WORKERS)
+    hashes = index.update(image_files)
+
+    # --- 1. Exact duplicates (byte-identical) ---
+    duplicates_found = 0
+    unique_hashes = set()
+    unique_files = []
+    for img_path in tqdm(image_files, desc="Cleaning exact duplicates"):
+        file_hash = hashes[img_path][0]
+        if file_hash in unique_hashes:
+            # DUPLICATE FOUND
+            duplicates_found += 1
+            remove_image(img_path, index)
+        else:
+            unique_hashes.add(file_hash)
+            unique_files.append(img_path)
+
+    # --- 2. Near duplicates (perceptual hash), reported with the splits they are in ---
+    groups = near_duplicate_groups([(p, hashes[p][1]) for p in unique_files], NEAR_DUPLICATE_DISTANCE)
+    report = []
+    leaks = 0
+    near_removed = 0
+    for group in groups:
+        splits = sorted(set(split_of(p) for p in group))
+        cross_split = len(splits) > 1
+        leaks += cross_split
+        report.append({
+            "keep": group[0],
+            "duplicates": [{"path": p, "distance": hamming(hashes[group[0]][1], hashes[p][1])} for p in group[1:]],
+            "splits": splits,
+            "cross_split": cross_split
+        })
+        if REMOVE_NEAR_DUPLICATES:
+            for img_path in group[1:]:
+                remove_image(img_path, index)
+                near_removed += 1
+
+    report_path = os.path.join(DATASET_DIR, "near_duplicates.json")
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    index.save()
 
     print(f"\n--- Cleanup Complete ---")
-    print(f"Total Unique Images: {total_files}")
+    print(f"Total Unique Images: {len(unique_files) - near_removed}")
     print(f"Duplicates Removed: {duplicates_found}")
+    print(f"Near-Duplicate Groups: {len(groups)} ({leaks} across splits = train/valid/test leakage)"
+          + (f", {near_removed} images removed" if REMOVE_NEAR_DUPLICATES else ""))
+    print(f"Report: {report_path}")
 
 if __name__ == "__main__":
     clean_duplicates()
@@ -1,86 +1,77 @@
 import os
-import hashlib
 from glob import glob
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import numpy as np
 
+from hash_index import HashIndex
+
 DATASET_DIR = r"C:\Users\anasf\Documents\SmartFactory\dataset"
+WORKERS = None # hashing / label cleaning processes, None = all cores
 
-def get_hash(filepath):
-    with open(filepath, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+def compute_iou_matrix(boxes):
+    """
+    IoU between all pairs of [x, y, w, h] (normalized) boxes, as an (N, N) array.
+    Same arithmetic as the old per-pair version (x1 = x - w/2, ..., 0 if the union is 0).
+    """
+    x, y, w, h = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    x1, y1, x2, y2 = x - w/2, y - h/2, x + w/2, y + h/2
 
-def compute_iou(box1, box2):
-    # box: [class, x, y, w, h] (normalized)
-    # Convert to x1, y1, x2, y2
-    def to_coords(b):
-        x, y, w, h = b[1], b[2], b[3], b[4]
-        x1 = x - w/2
-        y1 = y - h/2
-        x2 = x + w/2
-        y2 = y + h/2
-        return x1, y1, x2, y2
+    inter_w = np.maximum(0, np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]))
+    inter_h = np.maximum(0, np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]))
+    inter_area = inter_w * inter_h
 
-    b1_x1, b1_y1, b1_x2, b1_y2 = to_coords(box1)
-    b2_x1, b2_y1, b2_x2, b2_y2 = to_coords(box2)
-    
-    xi1 = max(b1_x1, b2_x1)
-    yi1 = max(b1_y1, b2_y1)
-    xi2 = min(b1_x2, b2_x2)
-    yi2 = min(b1_y2, b2_y2)
-    
-    inter_area = max(0, xi2 - xi1) * max(0, yi2 - yi1)
-    
-    b1_area = (b1_x2 - b1_x1) * (b1_y2 - b1_y1)
-    b2_area = (b2_x2 - b2_x1) * (b2_y2 - b2_y1)
-    
-    union_area = b1_area + b2_area - inter_area
-    
-    if union_area == 0: return 0
-    return inter_area / union_area
+    area = (x2 - x1) * (y2 - y1)
+    union_area = area[:, None] + area[None, :] - inter_area
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union_area == 0, 0.0, inter_area / union_area)
 
 def clean_labels_in_file(label_path):
-    if not os.path.exists(label_path): return
+    """
+    Remove duplicate boxes (same class, IoU > 0.9) from one label file.
+    Returns True if the file was rewritten (it is only written when its content changes).
+    """
+    if not os.path.exists(label_path): return False
     
     with open(label_path, 'r') as f:
-        lines = f.readlines()
-        
-    boxes = []
-    for line in lines:
-        parts = line.strip().split()
-        if len(parts) >= 5:
-            # cls, x, y, w, h
-            boxes.append([int(parts[0])] + [float(x) for x in parts[1:]])
-            
-    # Deduplicate (NMS style)
-    keep_indices = []
-    
-    # Sort by class then size (maybe?) - No, simple greedy NMS
-    # Actually, we just want to remove SAME class duplicates.
-    
-    for i in range(len(boxes)):
-        duplicate = False
-        for j in keep_indices:
-            # Check overlap
-            iou = compute_iou(boxes[i], boxes[j])
-            if iou > 0.9 and boxes[i][0] == boxes[j][0]: # Same class, exact same spot
-                duplicate = True
-                break
-        
-        if not duplicate:
-            keep_indices.append(i)
-            
-    # Write back
+        old_content = f.read()
+
+    # cls, x, y, w, h of every valid line, parsed in one go
+    rows = [parts[:5] for parts in (line.split() for line in old_content.splitlines()) if len(parts) >= 5]
+    if rows:
+        data = np.array(rows, dtype=np.float64)
+        cls_ids = data[:, 0].astype(np.int64)
+        boxes = data[:, 1:5]
+
+        # Greedy dedup (NMS style), same result as comparing each box with the kept ones:
+        # we just want to remove SAME class duplicates
+        duplicate_of = np.tril((compute_iou_matrix(boxes) > 0.9) & (cls_ids[:, None] == cls_ids[None, :]), -1)
+        # Boxes that match no earlier box are always kept. A box that does is dropped only if one
+        # of those earlier boxes was kept, which depends on the order, so only these (few) rows
+        # are resolved one by one, in file order
+        keep = ~duplicate_of.any(axis=1)
+        for i in np.flatnonzero(~keep):
+            keep[i] = not duplicate_of[i, :i][keep[:i]].any()
+    else:
+        keep = []
+
+    new_content = ''.join(
+        f"{cls_ids[i]} {boxes[i, 0]:.6f} {boxes[i, 1]:.6f} {boxes[i, 2]:.6f} {boxes[i, 3]:.6f}\n"
+        for i in np.flatnonzero(keep))
+
+    # Write back only if something changed
+    if new_content == old_content:
+        return False
     with open(label_path, 'w') as f:
-        for i in keep_indices:
-            b = boxes[i]
-            line = f"{int(b[0])} {b[1]:.6f} {b[2]:.6f} {b[3]:.6f} {b[4]:.6f}\n"
-            f.write(line)
+        f.write(new_content)
+    return True
 
 def merge_duplicates_logic():
     print(f"Scanning for Image Overlaps in {DATASET_DIR}...")
     
     files_map = {} # hash -> list of {img_path, lbl_path}
+    # Parallel hashing, cached between runs (only new/changed images are read)
+    index = HashIndex(DATASET_DIR, workers=WORKERS)
     
     for split in ['train', 'valid', 'test']:
         img_dir = os.path.join(DATASET_DIR, split, 'images')
@@ -89,8 +80,9 @@ def merge_duplicates_logic():
         if not os.path.exists(img_dir): continue
         
         images = glob(os.path.join(img_dir, "*.*"))
-        for img_path in tqdm(images, desc=f"Scanning {split}"):
-            h = get_hash(img_path)
+        hashes = index.update(images, desc=f"Scanning {split}")
+        for img_path in images:
+            h = hashes[img_path][0]
             
             base = os.path.splitext(os.path.basename(img_path))[0]
             lbl_path = os.path.join(lbl_dir, base + ".txt")
@@ -101,6 +93,7 @@ def merge_duplicates_logic():
             
     print("Processing Duplicates...")
     merged_count = 0
+    to_clean = [] # label files to dedup, done in parallel at the end
     
     for h, file_list in tqdm(files_map.items(), desc="Merging"):
         if len(file_list) > 1:
@@ -122,7 +115,7 @@ def merge_duplicates_logic():
                         f.write(l + "\n")
             
             # Clean Master (NMS)
-            clean_labels_in_file(master['lbl'])
+            to_clean.append(master['lbl'])
             
             # Delete the others
             for i in range(1, len(file_list)):
@@ -133,8 +126,14 @@ def merge_duplicates_logic():
             merged_count += 1
         else:
             # Even unique files might have internal duplicates (double lines)
-            clean_labels_in_file(file_list[0]['lbl'])
+            to_clean.append(file_list[0]['lbl'])
+
+    with ProcessPoolExecutor(max_workers=WORKERS) as pool:
+        changed = sum(tqdm(pool.map(clean_labels_in_file, to_clean, chunksize=256),
+                           total=len(to_clean), desc="Cleaning labels"))
 
+    index.save()
+    print(f"Cleaned {changed} label files.")
     print(f"Merged {merged_count} duplicate sets.")
     print("Dataset is now Unique and Clean.")
 
@@ -0,0 +1,141 @@
+"""
+Shared image hashing for the dataset scripts (deduplicate_dataset.py, fix_labels.py).
+
+- HashIndex: MD5 + perceptual hash (dHash) of every image, hashed in parallel by a process pool
+  and cached in <dataset>/.hash_index.json keyed by path, size and mtime, so re-runs only
+  hash new or modified files.
+- near_duplicate_groups: images whose dHashes differ by a few bits (same frame re-encoded,
+  resized or slightly recompressed by different Roboflow exports), found with multi-index
+  hashing (exact band matches as candidates, then a popcount check).
+"""
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+INDEX_NAME = ".hash_index.json"
+
+def hash_file(path):
+    """(md5 hex, 64-bit dHash or None if the file isn't a readable image). Reads the file once."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    md5 = hashlib.md5(data).hexdigest()
+    # Reduced decode (1/4 size) is much faster and plenty for a 9x8 thumbnail
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return md5, None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return md5, int(''.join('1' if b else '0' for b in bits), 2)
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class HashIndex:
+    def __init__(self, root, workers=None):
+        self.root = root
+        self.path = os.path.join(root, INDEX_NAME)
+        self.workers = workers
+        self.entries = {} # relative path -> [size, mtime_ns, md5, dhash]
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+
+    def _key(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def update(self, paths, desc="Hashing"):
+        """Hash new/changed files in parallel. Returns {path: (md5, dhash)} for all paths."""
+        stale = []
+        stats = {}
+        for path in paths:
+            st = os.stat(path)
+            stats[path] = (st.st_size, st.st_mtime_ns)
+            entry = self.entries.get(self._key(path))
+            if entry is None or (entry[0], entry[1]) != stats[path]:
+                stale.append(path)
+
+        print(f"{len(paths) - len(stale)} cached, {len(stale)} to hash")
+        if stale:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                hashed = pool.map(hash_file, stale, chunksize=64)
+                for path, (md5, dhash) in tqdm(zip(stale, hashed), total=len(stale), desc=desc):
+                    self.entries[self._key(path)] = [stats[path][0], stats[path][1], md5, dhash]
+
+        return {path: tuple(self.entries[self._key(path)][2:]) for path in paths}
+
+    def remove(self, path):
+        self.entries.pop(self._key(path), None)
+
+    def save(self):
+        # Forget files that no longer exist (deleted / moved by other scripts)
+        self.entries = {k: v for k, v in self.entries.items() if os.path.exists(os.path.join(self.root, k))}
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp, self.path)
+
+def popcount64(values):
+    """Number of set bits of each uint64 in an array."""
+    values = np.asarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'): # numpy >= 2.0
+        return np.bitwise_count(values).astype(np.int64)
+    as_bytes = values.reshape(-1).view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1).reshape(values.shape).astype(np.int64)
+
+def band_bounds(max_distance, bits=64):
+    """Bit ranges of the max_distance + 1 bands the hashes are split into (as equal as possible)."""
+    bands = min(max_distance + 1, bits)
+    return np.linspace(0, bits, bands + 1).astype(int)
+
+def near_duplicate_groups(items, max_distance=6, block=1024):
+    """
+    items: list of (key, dhash). Returns groups (lists of keys, in input order) of images
+    whose hashes are within max_distance bits of each other (transitively).
+
+    Multi-index hashing: the 64 bits are split into max_distance + 1 bands. Two hashes that differ
+    in at most max_distance bits agree exactly on at least one band (pigeonhole), so only hashes
+    sharing a band value are candidates; each candidate pair is confirmed with a popcount.
+    Buckets are compared in blocks of `block` rows with numpy, which keeps large buckets
+    (many near-identical frames) within memory.
+    """
+    valid = [i for i, (_, dhash) in enumerate(items) if dhash is not None]
+    hashes = np.array([items[i][1] for i in valid], dtype=np.uint64)
+    valid = np.array(valid, dtype=np.int64)
+
+    parent = list(range(len(items)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    bounds = band_bounds(max_distance)
+    for lo, hi in tqdm(list(zip(bounds[:-1], bounds[1:])), desc="Near-duplicates (bands)"):
+        keys = (hashes >> np.uint64(lo)) & np.uint64((1 << int(hi - lo)) - 1)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        edges = np.flatnonzero(np.diff(sorted_keys)) + 1
+        for start, stop in zip(np.r_[0, edges], np.r_[edges, len(order)]):
+            if stop - start < 2:
+                continue
+            members = order[start:stop]
+            bucket = hashes[members]
+            for row in range(0, len(members), block):
+                # Pairs (i, j) with i in this block and j after i in the bucket
+                rows = bucket[row:row + block]
+                close = popcount64(rows[:, None] ^ bucket[None, row:]) <= max_distance
+                ii, jj = np.nonzero(np.triu(close, 1))
+                for i, j in zip(valid[members[row + ii]].tolist(), valid[members[row + jj]].tolist()):
+                    ri, rj = find(i), find(j)
+                    if ri != rj:
+                        parent[max(ri, rj)] = min(ri, rj)
+
+    groups = {}
+    for i in range(len(items)):
+        groups.setdefault(find(i), []).append(i)
+    return [[items[i][0] for i in sorted(members)] for members in groups.values() if len(members) > 1]
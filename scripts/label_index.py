@@ -0,0 +1,230 @@
+"""
+Columnar index of all YOLO labels of the dataset, for instant statistics.
+
+    python label_index.py build                       # (re)index, only re-reads changed label files
+    python label_index.py report                      # class histogram, box sizes, empty labels per split
+    python label_index.py query --split valid --cls Mask --max-size 20 [--list]
+
+Stored in <dataset>/.label_index/:
+    boxes.npy  one row per box: split, image, cls, x, y, w, h (normalized) - memory-mapped by queries
+    files.npy  one row per label file: split, name, size, mtime, image width/height, first row, box count
+"""
+import os
+import argparse
+import time
+import numpy as np
+import yaml
+
+try:
+    from PIL import Image # only reads the image header for the pixel size
+except ImportError:
+    Image = None
+
+DATASET_DIR = r"C:\Users\anasf\Documents\SmartFactory\dataset"
+SPLITS = ['train', 'valid', 'test']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+DEFAULT_NAMES = ['Hardhat', 'NO-Hardhat', 'NO-Safety Vest', 'Person', 'Safety Vest',
+                 'Safety Gloves', 'Safety Boot', 'Safety Glasses', 'Mask']
+
+BOX_DTYPE = np.dtype([('split', 'u1'), ('image', 'i4'), ('cls', 'i2'),
+                      ('x', 'f4'), ('y', 'f4'), ('w', 'f4'), ('h', 'f4')])
+
+def file_dtype(name_len):
+    """Row dtype of files.npy, with the name column as wide as the longest label file name."""
+    return np.dtype([('split', 'u1'), ('name', f'U{max(name_len, 1)}'), ('size', 'i8'), ('mtime', 'i8'),
+                     ('img_w', 'i4'), ('img_h', 'i4'), ('start', 'i8'), ('count', 'i4')])
+
+def index_dir(root):
+    return os.path.join(root, '.label_index')
+
+def class_names(root):
+    yaml_path = os.path.join(root, 'data.yaml')
+    if os.path.exists(yaml_path):
+        with open(yaml_path, 'r') as f:
+            names = yaml.safe_load(f).get('names')
+        if isinstance(names, dict):
+            names = [names[k] for k in sorted(names)]
+        if names:
+            return list(names)
+    return DEFAULT_NAMES
+
+def parse_label(path):
+    """(N, 5) float array of cls, x, y, w, h for the valid lines of a label file."""
+    with open(path, 'r') as f:
+        rows = [parts[:5] for parts in (line.split() for line in f) if len(parts) >= 5]
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+def image_size(path):
+    if Image is None or path is None:
+        return 0, 0
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except OSError:
+        return 0, 0
+
+def load_index(root, mmap=True):
+    """(boxes, files) arrays, or (None, None) if the index hasn't been built yet."""
+    d = index_dir(root)
+    if not os.path.exists(os.path.join(d, 'files.npy')):
+        return None, None
+    boxes = np.load(os.path.join(d, 'boxes.npy'), mmap_mode='r' if mmap else None)
+    files = np.load(os.path.join(d, 'files.npy'))
+    return boxes, files
+
+def build_index(root):
+    """One pass over all label files; unchanged files (same size and mtime) reuse their indexed rows."""
+    start_time = time.time()
+    old_boxes, old_files = load_index(root)
+    previous = {}
+    if old_files is not None:
+        for row in old_files:
+            previous[(int(row['split']), str(row['name']))] = row
+
+    file_rows = []
+    reused = [] # (file row, start in the old index) of unchanged files
+    new_rows = {} # file row -> parsed boxes of new/changed files
+    for split_id, split in enumerate(SPLITS):
+        lbl_dir = os.path.join(root, split, 'labels')
+        img_dir = os.path.join(root, split, 'images')
+        if not os.path.exists(lbl_dir): continue
+        images = {}
+        if os.path.exists(img_dir):
+            for name in os.listdir(img_dir):
+                stem, ext = os.path.splitext(name)
+                if ext.lower() in IMAGE_EXTENSIONS:
+                    images[stem] = os.path.join(img_dir, name)
+
+        with os.scandir(lbl_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.txt'): continue
+                st = entry.stat()
+                old = previous.get((split_id, entry.name))
+                if old is not None and old['size'] == st.st_size and old['mtime'] == st.st_mtime_ns:
+                    reused.append((len(file_rows), int(old['start'])))
+                    file_rows.append((split_id, entry.name, st.st_size, st.st_mtime_ns,
+                                      int(old['img_w']), int(old['img_h']), 0, int(old['count'])))
+                else:
+                    data = parse_label(entry.path)
+                    new_rows[len(file_rows)] = data
+                    img_w, img_h = image_size(images.get(os.path.splitext(entry.name)[0]))
+                    file_rows.append((split_id, entry.name, st.st_size, st.st_mtime_ns, img_w, img_h, 0, len(data)))
+
+    files = np.array(file_rows, dtype=file_dtype(max((len(row[1]) for row in file_rows), default=1)))
+    counts = files['count'].astype(np.int64)
+    files['start'] = np.cumsum(counts) - counts
+    boxes = np.zeros(int(counts.sum()), dtype=BOX_DTYPE)
+    boxes['image'] = np.repeat(np.arange(len(files)), counts)
+    boxes['split'] = np.repeat(files['split'], counts)
+
+    # Unchanged files: copy all their rows from the old index with one gather
+    if reused:
+        rows, old_starts = np.array(reused, dtype=np.int64).T
+        n = counts[rows]
+        offsets = np.arange(int(n.sum())) - np.repeat(np.cumsum(n) - n, n)
+        src = np.repeat(old_starts, n) + offsets
+        dst = np.repeat(files['start'][rows], n) + offsets
+        for column in ('cls', 'x', 'y', 'w', 'h'):
+            boxes[column][dst] = old_boxes[column][src]
+    for row, data in new_rows.items():
+        sl = slice(files['start'][row], files['start'][row] + len(data))
+        boxes['cls'][sl] = data[:, 0]
+        boxes['x'][sl], boxes['y'][sl], boxes['w'][sl], boxes['h'][sl] = data[:, 1], data[:, 2], data[:, 3], data[:, 4]
+    parsed = len(new_rows)
+    # Release the memory map before overwriting the file it points to
+    del old_boxes
+
+    d = index_dir(root)
+    os.makedirs(d, exist_ok=True)
+    for name, array in (('boxes', boxes), ('files', files)):
+        tmp = os.path.join(d, name + '.tmp.npy')
+        np.save(tmp, array)
+        os.replace(tmp, os.path.join(d, name + '.npy'))
+    print(f"Indexed {len(files)} label files / {len(boxes)} boxes "
+          f"({parsed} re-read, {len(files) - parsed} unchanged) in {time.time() - start_time:.2f}s")
+
+def box_pixels(boxes, files, imgsz):
+    """(w, h) of each box in pixels (image size from the index, imgsz if it couldn't be read)."""
+    img_w = files['img_w'][boxes['image']].astype(np.float64)
+    img_h = files['img_h'][boxes['image']].astype(np.float64)
+    img_w[img_w == 0] = imgsz
+    img_h[img_h == 0] = imgsz
+    return boxes['w'] * img_w, boxes['h'] * img_h
+
+def report(root, split=None, imgsz=640):
+    boxes, files = load_index(root)
+    if files is None:
+        print("No index yet, run: python label_index.py build")
+        return
+    names = class_names(root)
+    w_px, h_px = box_pixels(boxes, files, imgsz)
+    size_px = np.sqrt(w_px * h_px)
+
+    for split_id, split_name in enumerate(SPLITS):
+        if split is not None and split != split_name: continue
+        in_split = boxes['split'] == split_id
+        split_files = files['split'] == split_id
+        if not split_files.any(): continue
+        empty = int(np.count_nonzero(files['count'][split_files] == 0))
+        print(f"\n=== {split_name}: {int(split_files.sum())} label files, {int(in_split.sum())} boxes, {empty} empty ===")
+        counts = np.bincount(boxes['cls'][in_split], minlength=len(names))
+        print(f"{'class':<16}{'boxes':>8}{'images':>8}{'<20px':>8}{'p10px':>8}{'p50px':>8}{'p90px':>8}")
+        for cls_id, count in enumerate(counts):
+            if count == 0: continue
+            sel = in_split & (boxes['cls'] == cls_id)
+            sizes = size_px[sel]
+            images = len(np.unique(boxes['image'][sel]))
+            p10, p50, p90 = np.percentile(sizes, [10, 50, 90])
+            name = names[cls_id] if cls_id < len(names) else str(cls_id)
+            print(f"{name:<16}{count:>8}{images:>8}{int(np.count_nonzero(sizes < 20)):>8}{p10:>8.0f}{p50:>8.0f}{p90:>8.0f}")
+
+def query(root, split=None, cls=None, min_size=None, max_size=None, imgsz=640, list_images=False):
+    """Count (and optionally list) boxes by split / class / size (sqrt(w*h) in pixels)."""
+    boxes, files = load_index(root)
+    if files is None:
+        print("No index yet, run: python label_index.py build")
+        return
+    names = class_names(root)
+    sel = np.ones(len(boxes), dtype=bool)
+    if split is not None:
+        sel &= boxes['split'] == SPLITS.index(split)
+    if cls is not None:
+        cls_id = int(cls) if str(cls).isdigit() else [n.lower() for n in names].index(cls.lower())
+        sel &= boxes['cls'] == cls_id
+    if min_size is not None or max_size is not None:
+        w_px, h_px = box_pixels(boxes, files, imgsz)
+        size_px = np.sqrt(w_px * h_px)
+        if min_size is not None:
+            sel &= size_px >= min_size
+        if max_size is not None:
+            sel &= size_px < max_size
+
+    image_ids = np.unique(boxes['image'][sel])
+    print(f"{int(sel.sum())} boxes in {len(image_ids)} images")
+    if list_images:
+        for image_id in image_ids:
+            print(f"{SPLITS[files['split'][image_id]]}/labels/{files['name'][image_id]}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar label index and dataset statistics.")
+    parser.add_argument('command', choices=('build', 'report', 'query'))
+    parser.add_argument('--dataset', default=DATASET_DIR)
+    parser.add_argument('--split', choices=SPLITS)
+    parser.add_argument('--cls', help="class name or ID")
+    parser.add_argument('--min-size', type=float, help="min box size sqrt(w*h) in pixels")
+    parser.add_argument('--max-size', type=float, help="max box size sqrt(w*h) in pixels (exclusive)")
+    parser.add_argument('--imgsz', type=int, default=640, help="image size to assume if it can't be read")
+    parser.add_argument('--list', action='store_true', help="list the matching label files")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        build_index(args.dataset)
+    elif args.command == 'report':
+        report(args.dataset, args.split, args.imgsz)
+    else:
+        query(args.dataset, args.split, args.cls, args.min_size, args.max_size, args.imgsz, args.list)
+    print(f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
 import os
+import json
 import shutil
+import hashlib
 import yaml
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
 # --- CONFIGURATION ---
 TARGET_DIR = r"C:\Users\anasf\Documents\SmartFactory\dataset"
+# Hardlink source images instead of copying them (instant, no extra disk space).
+# Needs TARGET_DIR and the sources on the same drive, otherwise it falls back to copying.
+LINK_FILES = False
+WORKERS = 16 # parallel file operations
+# What was merged from where (re-runs only touch changed sources / class maps)
+MANIFEST_NAME = ".merge_manifest.json"
 
 # NEW 9-CLASS SCHEMA:
 # 0: Hardhat
@@ -89,83 +98,172 @@ def clean_legacy_labels():
                     f.writelines(kept_lines)
     print("Legacy sanitization complete.")
 
+def source_tag(src_path):
+    """Stable short ID of a source: target names don't depend on the order of SOURCES."""
+    return hashlib.md5(os.path.normpath(src_path).lower().encode()).hexdigest()[:8]
+
+def map_key(class_map):
+    return hashlib.md5(json.dumps(sorted(class_map.items())).encode()).hexdigest()[:12]
+
+def file_stamp(path):
+    """(size, mtime_ns), or None if the file doesn't exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def load_manifest():
+    path = os.path.join(TARGET_DIR, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    path = os.path.join(TARGET_DIR, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+def place_image(src, dst):
+    """Copy (or hardlink with LINK_FILES) one image into the merged dataset."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    if LINK_FILES:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass # Different drive / filesystem without hardlinks -> copy
+    shutil.copy2(src, dst)
+
+def remap_label(src_label, target_label, lookup):
+    """
+    Rewrite the class IDs of one label file with a prebuilt str -> str lookup
+    (classes not in the map are dropped). Only writes if the result differs. Returns True if written.
+    """
+    new_lines = []
+    if src_label is not None:
+        with open(src_label, 'r') as f:
+            for line in f:
+                parts = line.split(None, 1)
+                if not parts: continue
+                new_id = lookup.get(parts[0])
+                if new_id is not None:
+                    new_lines.append(f"{new_id} {' '.join(parts[1].split()) if len(parts) > 1 else ''}\n")
+    content = ''.join(new_lines)
+
+    if os.path.exists(target_label):
+        with open(target_label, 'r') as f:
+            if f.read() == content:
+                return False
+    with open(target_label, 'w') as f:
+        f.write(content)
+    return True
+
 def merge_datasets():
     print(f"Target Dataset: {TARGET_DIR}")
-    
-    # 1. Clean previous merge ("new_*" files) to strictly avoid duplicates
-    print("Cleaning up previous merge artifacts...")
-    for split in ['train', 'valid', 'test']:
-        for sub in ['images', 'labels']:
-            d = os.path.join(TARGET_DIR, split, sub)
-            if os.path.exists(d):
-                files = glob(os.path.join(d, "new_*"))
-                for f in files:
-                    os.remove(f)
-                    
+
+    # 1. No manifest = first run (or merged by the old script with order-dependent names):
+    #    clean previous merge ("new_*" files) to strictly avoid duplicates
+    manifest = load_manifest()
+    if manifest is None:
+        print("No merge manifest found, cleaning up previous merge artifacts...")
+        for split in ['train', 'valid', 'test']:
+            for sub in ['images', 'labels']:
+                d = os.path.join(TARGET_DIR, split, sub)
+                if os.path.exists(d):
+                    files = glob(os.path.join(d, "new_*"))
+                    for f in files:
+                        os.remove(f)
+        manifest = {"files": {}}
+    previous = manifest["files"] # target image (relative) -> entry of the last merge
+
     # 2. Sanitize Legacy Data
     clean_legacy_labels()
 
-    # 3. Merge New Data
-    global_img_count = 0
-
+    # 3. Plan the merge: only images / labels whose source or class map changed need work
+    wanted = {}
+    image_jobs, label_jobs = [], []
+    deleted = 0
+    missing_sources = set()
     for source in SOURCES:
         src_path = source['path']
         class_map = source['map']
-        
+        tag = source_tag(src_path)
+        key = map_key(class_map)
+        lookup = {str(k): str(v) for k, v in class_map.items()}
+
         print(f"\nProcessing Source: {src_path}")
         if not os.path.exists(src_path):
-            print(f"Skipping (Not Found): {src_path}")
+            # Keep what was merged from it before (e.g. external drive not plugged in)
+            print(f"Skipping (Not Found), keeping its previously merged files: {src_path}")
+            missing_sources.add(tag)
             continue
 
         for split in ['train', 'valid', 'test']:
             src_split_dir = os.path.join(src_path, split)
             if split == 'valid' and not os.path.exists(src_split_dir):
                 src_split_dir = os.path.join(src_path, 'val')
-            
+
             if not os.path.exists(src_split_dir):
                 continue
-                
-            print(f"  Merging '{split}' set...")
-            
-            src_images = glob(os.path.join(src_split_dir, 'images', '*.*'))
-            
-            for img_path in tqdm(src_images):
+
+            os.makedirs(os.path.join(TARGET_DIR, split, 'images'), exist_ok=True)
+            os.makedirs(os.path.join(TARGET_DIR, split, 'labels'), exist_ok=True)
+            for img_path in glob(os.path.join(src_split_dir, 'images', '*.*')):
                 filename = os.path.basename(img_path)
-                new_filename = f"new_{global_img_count}_{filename}"
-                
+                new_filename = f"new_{tag}_{filename}"
+                rel_img = f"{split}/images/{new_filename}"
                 target_img_path = os.path.join(TARGET_DIR, split, 'images', new_filename)
-                shutil.copy2(img_path, target_img_path)
-                
-                label_name = os.path.splitext(filename)[0] + '.txt'
-                src_label_path = os.path.join(src_split_dir, 'labels', label_name)
                 target_label_path = os.path.join(TARGET_DIR, split, 'labels', os.path.splitext(new_filename)[0] + '.txt')
-                
-                new_lines = []
-                if os.path.exists(src_label_path):
-                    with open(src_label_path, 'r') as f:
-                        lines = f.readlines()
-                    
-                    for line in lines:
-                        parts = line.strip().split()
-                        if not parts: continue
-                        
-                        cls_id = int(parts[0])
-                        
-                        if cls_id in class_map:
-                            new_id = class_map[cls_id]
-                            new_line = f"{new_id} {' '.join(parts[1:])}\n"
-                            new_lines.append(new_line)
-                    
-                    if new_lines:
-                        with open(target_label_path, 'w') as f:
-                            f.writelines(new_lines)
-                    else:
-                        open(target_label_path, 'w').close() 
-                else:
-                    open(target_label_path, 'w').close()
-                
-                global_img_count += 1
-                
+                src_label_path = os.path.join(src_split_dir, 'labels', os.path.splitext(filename)[0] + '.txt')
+
+                entry = {"source": tag, "image": file_stamp(img_path),
+                         "label": file_stamp(src_label_path), "map": key}
+                wanted[rel_img] = entry
+                old = previous.get(rel_img)
+
+                # Merged before and gone now: removed on purpose (deduplicate_dataset.py, fix_labels.py).
+                # Remember that instead of copying it back; it only returns if the source image changes.
+                if old is not None and old["image"] == entry["image"] and (
+                        old.get("deleted") or not os.path.exists(target_img_path)):
+                    entry["deleted"] = True
+                    deleted += 1
+                    continue
+
+                if old is None or old["image"] != entry["image"]:
+                    image_jobs.append((img_path, target_img_path))
+                if old is None or old.get("deleted") or old["label"] != entry["label"] or old["map"] != key:
+                    label_jobs.append((src_label_path if entry["label"] else None, target_label_path, lookup))
+
+    # Files of sources that were removed from SOURCES (or images deleted in a source)
+    stale = [rel for rel, entry in previous.items()
+             if rel not in wanted and entry["source"] not in missing_sources]
+    for rel in previous:
+        if rel not in wanted and previous[rel]["source"] in missing_sources:
+            wanted[rel] = previous[rel]
+
+    # 4. Do the file work in parallel (I/O bound: threads)
+    print(f"\n{len(image_jobs)} image(s) to {'link' if LINK_FILES else 'copy'}, "
+          f"{len(label_jobs)} label(s) to remap, {len(stale)} stale file(s) to remove, "
+          f"{len(wanted) - len(image_jobs) - deleted} image(s) unchanged, "
+          f"{deleted} deleted by the cleanup scripts (not restored)")
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        list(tqdm(pool.map(lambda job: place_image(*job), image_jobs), total=len(image_jobs), desc="Images"))
+        written = sum(tqdm(pool.map(lambda job: remap_label(*job), label_jobs), total=len(label_jobs), desc="Labels"))
+        for rel in stale:
+            split, _, name = rel.split('/')
+            for path in (os.path.join(TARGET_DIR, split, 'images', name),
+                         os.path.join(TARGET_DIR, split, 'labels', os.path.splitext(name)[0] + '.txt')):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    manifest["files"] = wanted
+    save_manifest(manifest)
+    global_img_count = len(wanted) - deleted
+
     # 4. UPDATE data.yaml
     yaml_path = os.path.join(TARGET_DIR, 'data.yaml')
     new_config = {
@@ -180,7 +278,7 @@ def merge_datasets():
         yaml.safe_dump(new_config, f)
 
     print("\nMerge Complete!")
-    print(f"Total processed images: {global_img_count}")
+    print(f"Total merged images: {global_img_count} ({len(image_jobs)} copied/linked, {written} labels rewritten)")
     print("Schema updated to 9 classes. Ready to train.")
 
 if __name__ == "__main__":
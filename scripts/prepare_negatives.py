@@ -1,4 +1,29 @@
 import os
+import sys
+import json
+import shutil
+import argparse
+import time
+from multiprocessing import Pool
+
+from tqdm import tqdm
+
+# The miner runs the live detector (same filters as the app)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+SUPPORTED_EXT = ('.jpg', '.jpeg', '.png', '.bmp')
+# Classes whose detections on background images are false positives. Person / NO-Hardhat /
+# NO-Safety Vest are usually right on the "people and hair" folders negatives come from,
+# images with only those must not become empty (= "nothing here") labels.
+MINE_CLASSES = ['Hardhat', 'Safety Vest', 'Safety Gloves', 'Safety Boot', 'Safety Glasses', 'Mask']
+
+def list_images(images_dir):
+    return sorted(f for f in os.listdir(images_dir) if os.path.splitext(f)[1].lower() in SUPPORTED_EXT)
+
+def label_stems(labels_dir):
+    if not os.path.exists(labels_dir):
+        return set()
+    return {os.path.splitext(f)[0] for f in os.listdir(labels_dir) if f.endswith('.txt')}
 
 def create_negative_labels(images_dir):
     """
@@ -19,7 +44,6 @@ def create_negative_labels(images_dir):
         return
 
     count = 0
-    supported_ext = ['.jpg', '.jpeg', '.png', '.bmp']
     
     # Ensure a 'labels' folder exists? 
     # Usually YOLO structure is images/ and labels/ parallel.
@@ -42,26 +66,171 @@ def create_negative_labels(images_dir):
     else:
         print(f"Found 'labels' directory: {labels_dir}")
 
-    for filename in os.listdir(images_dir):
-        base, ext = os.path.splitext(filename)
-        
-        if ext.lower() in supported_ext:
-            label_file = os.path.join(labels_dir, base + ".txt")
-            
-            # Create empty file if it doesn't exist
-            if not os.path.exists(label_file):
-                open(label_file, 'w').close()
-                count += 1
-                # print(f"Created negative label: {label_file}")
-            else:
-                # If file exists, check if empty? No, safer to leave existing labels alone 
-                # in case user mixed positive/negative samples.
-                pass
+    # One directory scan each instead of an exists() check per image
+    existing = label_stems(labels_dir)
+    for filename in list_images(images_dir):
+        base = os.path.splitext(filename)[0]
+        # Create empty file if it doesn't exist
+        # (existing labels are left alone in case user mixed positive/negative samples)
+        if base not in existing:
+            open(os.path.join(labels_dir, base + ".txt"), 'w').close()
+            count += 1
                 
     print(f"Done! Created {count} empty label files.")
     print("These images are now 'Negative Samples'. Re-train your model to apply this fix.")
 
+# --- Hard-negative mining ---
+# Background images (no PPE at all) on which the detector still fires are the useful negatives:
+# hair flagged as Hardhat, orange walls as Safety Vest, ... Images it already gets right teach nothing.
+
+detector = None
+worker_args = None
+worker_error = None
+
+def init_worker(args):
+    """Pool initializer: one detector per process, loaded once and reused for all its chunks."""
+    global detector, worker_args, worker_error
+    import cv2
+    cv2.setNumThreads(1)
+    sys.path.insert(0, BACKEND_DIR)
+    from detector import PPE_Detector
+    worker_args = args
+    detector = PPE_Detector(args.model, tracking=False, backend=args.backend, imgsz=args.imgsz,
+                            int8=args.int8, threads=args.threads)
+    # Safe Mode finds nothing (every image would be recorded as clean and skipped by later runs)
+    # and the COCO fallback's class IDs aren't PPE classes. Raised from mine_chunk, an exception
+    # in the initializer would only make the pool restart the worker forever
+    if detector.model is None or detector.fallback:
+        worker_error = f"PPE model {args.model} ({args.backend}) could not be loaded, nothing was mined"
+
+def mine_chunk(paths):
+    """
+    Run the detector over a chunk of images in batches.
+    Returns ([(path, [labels])] of the images with detections of args.classes, images checked).
+    """
+    import cv2
+    if worker_error:
+        raise RuntimeError(worker_error)
+    args = worker_args
+    classes = set(c.lower() for c in args.classes)
+    hits = []
+    for i in range(0, len(paths), args.batch):
+        batch_paths, frames = [], []
+        for path in paths[i:i + args.batch]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                batch_paths.append(path)
+                frames.append(frame)
+        if not frames:
+            continue
+        for path, (detections, _) in zip(batch_paths, detector.detect_batch(frames, headless=True)):
+            labels = sorted(set(det['label'] for det in detections
+                                if det['conf'] >= args.conf and det['label'].lower() in classes))
+            if labels:
+                hits.append((path, labels))
+    return hits, len(paths)
+
+def mine_hard_negatives(args):
+    """
+    Keep only the images of args.images_dir the detector produces false positives on:
+    they are copied (hardlinked if possible) to <out>/images with an empty label in <out>/labels,
+    ready to be merged into the dataset. Every checked image is appended to <out>/hard_negatives.jsonl
+    ({"image": name, "labels": [false positive labels, empty = clean]}) after each chunk, so an
+    interrupted run over a large folder continues where it stopped.
+    """
+    if not os.path.exists(args.images_dir):
+        print(f"Error: Directory not found: {args.images_dir}")
+        return
+    out_images = os.path.join(args.out, 'images')
+    out_labels = os.path.join(args.out, 'labels')
+    os.makedirs(out_images, exist_ok=True)
+    os.makedirs(out_labels, exist_ok=True)
+
+    report_path = os.path.join(args.out, 'hard_negatives.jsonl')
+    # Images already found (hits) or already checked without false positives (clean) by an earlier run
+    hits, clean = {}, set()
+    if os.path.exists(report_path):
+        with open(report_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError: # last line of a killed run
+                    continue
+                if entry['labels']:
+                    hits[entry['image']] = entry['labels']
+                else:
+                    clean.add(entry['image'])
+    done = clean | set(hits)
+    todo = [os.path.join(args.images_dir, f) for f in list_images(args.images_dir) if f not in done]
+    print(f"{len(done)} images already checked, {len(todo)} to check with {args.workers} worker(s)")
+
+    chunks = [todo[i:i + args.chunk] for i in range(0, len(todo), args.chunk)]
+    start = time.time()
+
+    if chunks:
+        with Pool(args.workers, initializer=init_worker, initargs=(args,)) as pool, \
+                open(report_path, 'a') as report, tqdm(total=len(todo), desc="Mining") as bar:
+            for chunk, (chunk_hits, checked) in zip(chunks, pool.imap(mine_chunk, chunks)):
+                hit_paths = set()
+                for path, labels in chunk_hits:
+                    filename = os.path.basename(path)
+                    hit_paths.add(path)
+                    hits[filename] = labels
+                    target = os.path.join(out_images, filename)
+                    if not os.path.exists(target):
+                        try:
+                            os.link(path, target)
+                        except OSError: # other drive / filesystem without hardlinks
+                            shutil.copy2(path, target)
+                    open(os.path.join(out_labels, os.path.splitext(filename)[0] + ".txt"), 'w').close()
+                lines = []
+                for path in chunk:
+                    filename = os.path.basename(path)
+                    if path not in hit_paths:
+                        clean.add(filename)
+                    lines.append(json.dumps({"image": filename, "labels": hits.get(filename, [])}) + "\n")
+                # Only this chunk is written (appended), not the whole report again
+                report.writelines(lines)
+                report.flush()
+                bar.update(checked)
+                bar.set_postfix(hard_negatives=len(hits))
+
+    elapsed = time.time() - start
+    per_label = {}
+    for labels in hits.values():
+        for label in labels:
+            per_label[label] = per_label.get(label, 0) + 1
+    print(f"Done! {len(hits)} hard negatives of {len(hits) + len(clean)} images checked "
+          f"({len(todo) / max(elapsed, 1e-9):.1f} images/s this run).")
+    for label, count in sorted(per_label.items(), key=lambda kv: -kv[1]):
+        print(f"  {label}: {count}")
+    print(f"Copied to {args.out} with empty labels - merge them into the dataset and re-train.")
+
 if __name__ == "__main__":
     # USER: Set this path to your folder of "Background Images" (No PPE, just people/hair)
     target_dir = r"C:\Users\anasf\OneDrive\Desktop\negatives"
-    create_negative_labels(target_dir.strip())
+
+    parser = argparse.ArgumentParser(description="Negative samples: empty labels for background images.")
+    parser.add_argument('images_dir', nargs='?', default=target_dir.strip())
+    parser.add_argument('--mine', action='store_true',
+                        help="only keep the images the detector produces false positives on (hard negatives)")
+    parser.add_argument('--out', help="mining output folder (default: <images_dir>_hard_negatives)")
+    parser.add_argument('--model', default=os.path.join(BACKEND_DIR, 'best.pt'))
+    parser.add_argument('--backend', default='torch', choices=('torch', 'onnx', 'openvino'))
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true')
+    parser.add_argument('--threads', type=int, default=1, help="inference threads per worker")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch', type=int, default=16, help="images per model call")
+    parser.add_argument('--chunk', type=int, default=256, help="images per work item / report checkpoint")
+    parser.add_argument('--classes', nargs='+', default=MINE_CLASSES,
+                        help="classes that count as false positives (default: the PPE classes)")
+    parser.add_argument('--conf', type=float, default=0.25,
+                        help="min confidence of a (filtered) detection to count as a false positive")
+    args = parser.parse_args()
+
+    if args.mine:
+        args.out = args.out or args.images_dir.rstrip('\\/') + '_hard_negatives'
+        mine_hard_negatives(args)
+    else:
+        create_negative_labels(args.images_dir)
@@ -1,23 +1,34 @@
 from ultralytics import YOLO
 import os
 
-# Find latest training run
-runs_dir = r"C:\Users\anasf\Documents\SmartFactory\runs\detect"
-if not os.path.exists(runs_dir):
-    print("No training runs found.")
-    exit()
+from training_cache import build_cache
 
-subdirs = [os.path.join(runs_dir, d) for d in os.listdir(runs_dir) if os.path.isdir(os.path.join(runs_dir, d))]
-latest_run = max(subdirs, key=os.path.getmtime)
+USE_CACHE = True # train on the pre-letterboxed copy of the dataset (see training_cache.py)
+DATA_YAML = r"C:\Users\anasf\Documents\SmartFactory\dataset\data.yaml"
 
-# Path to last checkpoint
-last_ckpt = os.path.join(latest_run, "weights", "last.pt")
+def resume_training():
+    # Find latest training run
+    runs_dir = r"C:\Users\anasf\Documents\SmartFactory\runs\detect"
+    if not os.path.exists(runs_dir):
+        print("No training runs found.")
+        return
 
-if os.path.exists(last_ckpt):
-    print(f"Resuming from: {last_ckpt}")
-    model = YOLO(last_ckpt)
-    model.train(resume=True)
-else:
-    print(f"No checkpoint found in {latest_run}. Starting fresh.")
-    model = YOLO("yolov8n.pt")
-    model.train(data=r"C:\Users\anasf\Documents\SmartFactory\dataset\data.yaml", epochs=5, imgsz=640, plots=True)
+    subdirs = [os.path.join(runs_dir, d) for d in os.listdir(runs_dir) if os.path.isdir(os.path.join(runs_dir, d))]
+    latest_run = max(subdirs, key=os.path.getmtime)
+
+    # Path to last checkpoint
+    last_ckpt = os.path.join(latest_run, "weights", "last.pt")
+
+    if os.path.exists(last_ckpt):
+        print(f"Resuming from: {last_ckpt}")
+        model = YOLO(last_ckpt)
+        model.train(resume=True)
+    else:
+        print(f"No checkpoint found in {latest_run}. Starting fresh.")
+        model = YOLO("yolov8n.pt")
+        data = build_cache(os.path.dirname(DATA_YAML), 640) if USE_CACHE else DATA_YAML
+        model.train(data=data, epochs=5, imgsz=640, plots=True, cache='disk' if USE_CACHE else False)
+
+# Guard: build_cache() uses worker processes, which re-import this file on Windows
+if __name__ == "__main__":
+    resume_training()
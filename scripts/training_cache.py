@@ -0,0 +1,179 @@
+"""
+Pre-resized copy of the dataset for training (train.py / resume_training.py).
+
+The merged dataset holds full-resolution images from several Roboflow exports, so every
+epoch would decode and resize large JPEGs again. This writes every image letterboxed to the
+training imgsz (same train/valid/test layout, labels remapped to the padded image) into
+<dataset>_cache<imgsz>/ with its own data.yaml:
+
+    python training_cache.py            # build / update the cache
+    model.train(data=build_cache(DATASET_DIR, 640), cache='disk', ...)
+
+With cache='disk' ultralytics additionally stores each decoded image as a .npy next to it
+(loaded without JPEG decoding), small now since the images are already at imgsz.
+
+The cache keeps a manifest of the source files (size, mtime): re-runs only redo new or
+changed images and delete the ones removed from the dataset. Changing imgsz or the class
+names rebuilds it from scratch.
+"""
+import os
+import sys
+import json
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import yaml
+from tqdm import tqdm
+
+# Same letterbox as the exported models use at inference time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from inference import letterbox
+
+DATASET_DIR = r"C:\Users\anasf\Documents\SmartFactory\dataset"
+IMGSZ = 640
+SPLITS = ['train', 'valid', 'test']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+JPEG_QUALITY = 95
+WORKERS = None # resizing processes, None = all cores
+MANIFEST_NAME = ".cache_manifest.json"
+
+def cache_dir_for(dataset_dir, imgsz):
+    return os.path.normpath(dataset_dir) + f"_cache{imgsz}"
+
+def remap_labels(lines, w, h, gain, pad, imgsz):
+    """YOLO label lines of the original image -> lines for the letterboxed image."""
+    out = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 5: continue
+        x, y, bw, bh = (float(v) for v in parts[1:5])
+        x = (x * w * gain + pad[0]) / imgsz
+        y = (y * h * gain + pad[1]) / imgsz
+        bw = bw * w * gain / imgsz
+        bh = bh * h * gain / imgsz
+        out.append(f"{parts[0]} {x:.6f} {y:.6f} {bw:.6f} {bh:.6f}")
+    return out
+
+def cache_image(task):
+    """Letterbox one image and write it with its remapped label. Returns False if the image is unreadable."""
+    src_img, src_lbl, dst_img, dst_lbl, imgsz = task
+    frame = cv2.imread(src_img)
+    if frame is None:
+        return False
+    h, w = frame.shape[:2]
+    image, gain, pad = letterbox(frame, imgsz)
+    # A stale ultralytics .npy of the old version would otherwise be loaded instead of the new image
+    npy = os.path.splitext(dst_img)[0] + '.npy'
+    if os.path.exists(npy):
+        os.remove(npy)
+    cv2.imwrite(dst_img, image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+
+    lines = []
+    if src_lbl is not None:
+        with open(src_lbl, 'r') as f:
+            lines = remap_labels(f.read().splitlines(), w, h, gain, pad, imgsz)
+    with open(dst_lbl, 'w') as f:
+        f.write("\n".join(lines) + ("\n" if lines else ""))
+    return True
+
+def load_manifest(cache_dir):
+    path = os.path.join(cache_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def build_cache(dataset_dir=DATASET_DIR, imgsz=IMGSZ, workers=WORKERS):
+    """Create / update the cache of dataset_dir at imgsz. Returns the path of its data.yaml."""
+    start = time.time()
+    cache_dir = cache_dir_for(dataset_dir, imgsz)
+    with open(os.path.join(dataset_dir, 'data.yaml'), 'r') as f:
+        data = yaml.safe_load(f)
+
+    manifest = load_manifest(cache_dir)
+    if manifest is not None and (manifest.get('imgsz') != imgsz or manifest.get('names') != data.get('names')):
+        print("Image size or classes changed, rebuilding the cache from scratch.")
+        shutil.rmtree(cache_dir)
+        manifest = None
+    files = manifest['files'] if manifest else {} # rel image path -> [img size, img mtime, lbl size, lbl mtime]
+
+    tasks, keys, current = [], [], {}
+    for split in SPLITS:
+        img_dir = os.path.join(dataset_dir, split, 'images')
+        if not os.path.exists(img_dir): continue
+        lbl_dir = os.path.join(dataset_dir, split, 'labels')
+        out_img_dir = os.path.join(cache_dir, split, 'images')
+        out_lbl_dir = os.path.join(cache_dir, split, 'labels')
+        os.makedirs(out_img_dir, exist_ok=True)
+        os.makedirs(out_lbl_dir, exist_ok=True)
+        # One scan of the labels folder instead of an exists() check per image
+        labels = {}
+        if os.path.exists(lbl_dir):
+            with os.scandir(lbl_dir) as entries:
+                labels = {e.name[:-4]: e for e in entries if e.name.endswith('.txt')}
+
+        with os.scandir(img_dir) as entries:
+            for entry in entries:
+                base, ext = os.path.splitext(entry.name)
+                if ext.lower() not in IMAGE_EXTENSIONS: continue
+                st = entry.stat()
+                lbl = labels.get(base)
+                lst = lbl.stat() if lbl is not None else None
+                key = f"{split}/{entry.name}"
+                current[key] = [st.st_size, st.st_mtime_ns,
+                                lst.st_size if lst else -1, lst.st_mtime_ns if lst else -1]
+                if files.get(key) != current[key]:
+                    # Cached images are always JPEG, whatever the source format
+                    keys.append(key)
+                    tasks.append((entry.path, lbl.path if lbl is not None else None,
+                                  os.path.join(out_img_dir, base + '.jpg'),
+                                  os.path.join(out_lbl_dir, base + '.txt'), imgsz))
+
+    # Images removed from the dataset (or renamed): drop their cached copies
+    removed = [key for key in files if key not in current]
+    for key in removed:
+        split, name = key.split('/', 1)
+        base = os.path.splitext(name)[0]
+        for path in (os.path.join(cache_dir, split, 'images', base + '.jpg'),
+                     os.path.join(cache_dir, split, 'images', base + '.npy'),
+                     os.path.join(cache_dir, split, 'labels', base + '.txt')):
+            if os.path.exists(path):
+                os.remove(path)
+        del files[key]
+
+    print(f"Training cache {cache_dir}: {len(current) - len(tasks)} up to date, "
+          f"{len(tasks)} to resize, {len(removed)} removed")
+    failed = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for key, task, ok in tqdm(zip(keys, tasks, pool.map(cache_image, tasks, chunksize=32)),
+                                      total=len(tasks), desc=f"Letterboxing to {imgsz}"):
+                if ok:
+                    files[key] = current[key]
+                else:
+                    failed += 1
+                    print(f"Unreadable image, skipped: {task[0]}")
+
+    cache_data = dict(data)
+    cache_data['path'] = os.path.abspath(cache_dir)
+    for split, key in (('train', 'train'), ('valid', 'val'), ('test', 'test')):
+        if os.path.exists(os.path.join(cache_dir, split, 'images')):
+            cache_data[key] = f"{split}/images"
+        else:
+            cache_data.pop(key, None)
+    yaml_path = os.path.join(cache_dir, 'data.yaml')
+    with open(yaml_path, 'w') as f:
+        yaml.safe_dump(cache_data, f, sort_keys=False)
+
+    tmp = os.path.join(cache_dir, MANIFEST_NAME + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump({'imgsz': imgsz, 'names': data.get('names'), 'files': files}, f)
+    os.replace(tmp, os.path.join(cache_dir, MANIFEST_NAME))
+
+    print(f"Cache ready in {time.time() - start:.1f}s ({failed} failed): {yaml_path}")
+    return yaml_path
+
+if __name__ == "__main__":
+    build_cache()
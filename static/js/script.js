@@ -14,34 +14,37 @@ document.addEventListener('DOMContentLoaded', () => {
         clockEl.textContent = now.toLocaleTimeString();
     }, 1000);
 
+    // Render a stats update (pushed by /api/stream, or polled from /api/status as fallback)
+    function renderStats(data) {
+        totalDetectedEl.textContent = data.total_people;
+
+        // Animate violation count if it changes
+        if (data.violations !== parseInt(totalViolationsEl.textContent)) {
+            totalViolationsEl.textContent = data.violations;
+            // Add log entry
+            if (data.violations > lastViolationCount) {
+                addLog(`⚠️ Violation Detected! Count: ${data.violations}`);
+            }
+            lastViolationCount = data.violations;
+        }
+
+        // Update Status Indicator
+        if (data.violations > 0) {
+            statusIndicatorEl.classList.add('danger');
+            statusIndicatorEl.classList.remove('success');
+            statusTextEl.textContent = "ATTENTION REQUIRED";
+        } else {
+            statusIndicatorEl.classList.remove('danger');
+            statusIndicatorEl.classList.add('success');
+            statusTextEl.textContent = "SAFE";
+        }
+    }
+
     // Poll API for status updates
     function updateMsg() {
         fetch('/api/status')
             .then(response => response.json())
-            .then(data => {
-                totalDetectedEl.textContent = data.total_people;
-
-                // Animate violation count if it changes
-                if (data.violations !== parseInt(totalViolationsEl.textContent)) {
-                    totalViolationsEl.textContent = data.violations;
-                    // Add log entry
-                    if (data.violations > lastViolationCount) {
-                        addLog(`⚠️ Violation Detected! Count: ${data.violations}`);
-                    }
-                    lastViolationCount = data.violations;
-                }
-
-                // Update Status Indicator
-                if (data.violations > 0) {
-                    statusIndicatorEl.classList.add('danger');
-                    statusIndicatorEl.classList.remove('success');
-                    statusTextEl.textContent = "ATTENTION REQUIRED";
-                } else {
-                    statusIndicatorEl.classList.remove('danger');
-                    statusIndicatorEl.classList.add('success');
-                    statusTextEl.textContent = "SAFE";
-                }
-            })
+            .then(renderStats)
             .catch(error => console.error('Error fetching stats:', error));
     }
 
@@ -57,6 +60,22 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // Poll every 500ms
-    setInterval(updateMsg, 500);
+    // Server push: the backend sends the stats only when they change
+    function startPolling() {
+        // Poll every 500ms
+        setInterval(updateMsg, 500);
+    }
+
+    if (window.EventSource) {
+        const source = new EventSource('/api/stream');
+        source.addEventListener('stats', event => renderStats(JSON.parse(event.data)));
+        source.onerror = () => {
+            // EventSource reconnects by itself; only fall back if it gave up (old backend)
+            if (source.readyState === EventSource.CLOSED) {
+                startPolling();
+            }
+        };
+    } else {
+        startPolling();
+    }
 });
@@ -0,0 +1,73 @@
+import os
+import sys
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from fix_labels import compute_iou_matrix, clean_labels_in_file
+
+def reference_iou(box1, box2):
+    """The original per-pair IoU of fix_labels.py (box: [cls, x, y, w, h], normalized)."""
+    def to_coords(b):
+        x, y, w, h = b[1], b[2], b[3], b[4]
+        return x - w/2, y - h/2, x + w/2, y + h/2
+
+    b1_x1, b1_y1, b1_x2, b1_y2 = to_coords(box1)
+    b2_x1, b2_y1, b2_x2, b2_y2 = to_coords(box2)
+    inter_area = max(0, min(b1_x2, b2_x2) - max(b1_x1, b2_x1)) * max(0, min(b1_y2, b2_y2) - max(b1_y1, b2_y1))
+    union_area = (b1_x2 - b1_x1) * (b1_y2 - b1_y1) + (b2_x2 - b2_x1) * (b2_y2 - b2_y1) - inter_area
+    if union_area == 0: return 0
+    return inter_area / union_area
+
+def reference_keep(boxes):
+    """The original greedy dedup: compare each box with the boxes kept so far."""
+    keep_indices = []
+    for i in range(len(boxes)):
+        if not any(reference_iou(boxes[i], boxes[j]) > 0.9 and boxes[i][0] == boxes[j][0] for j in keep_indices):
+            keep_indices.append(i)
+    return keep_indices
+
+def random_boxes(rng, count):
+    """Random [cls, x, y, w, h] boxes plus jittered copies (some over the 0.9 IoU threshold, some chained)."""
+    boxes = []
+    for _ in range(count):
+        if boxes and rng.random() < 0.5:
+            cls, x, y, w, h = rng.choice(boxes)
+            jitter = rng.choice((0.0, 0.002, 0.01, 0.05))
+            boxes.append([cls if rng.random() < 0.8 else rng.randrange(3),
+                          x + rng.uniform(-jitter, jitter), y + rng.uniform(-jitter, jitter), w, h])
+        else:
+            boxes.append([rng.randrange(3), rng.random(), rng.random(),
+                          rng.choice((0.0, rng.uniform(0.01, 0.5))), rng.uniform(0.01, 0.5)])
+    # Round like the label files, so the written file can be compared line by line
+    return [[b[0]] + [float(f"{v:.6f}") for v in b[1:]] for b in boxes]
+
+class CleanLabelsTest(unittest.TestCase):
+    def test_iou_matrix_matches_per_pair(self):
+        rng = random.Random(0)
+        boxes = random_boxes(rng, 80)
+        matrix = compute_iou_matrix(np.array([b[1:] for b in boxes], dtype=np.float64))
+        for i, a in enumerate(boxes):
+            for j, b in enumerate(boxes):
+                self.assertEqual(matrix[i, j], reference_iou(a, b), f"boxes {i}, {j}")
+
+    def test_keep_set_matches_greedy(self):
+        rng = random.Random(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'label.txt')
+            for trial in range(200):
+                boxes = random_boxes(rng, rng.randint(0, 40))
+                with open(path, 'w') as f:
+                    f.write(''.join(f"{b[0]} {b[1]:.6f} {b[2]:.6f} {b[3]:.6f} {b[4]:.6f}\n" for b in boxes))
+                clean_labels_in_file(path)
+                with open(path, 'r') as f:
+                    got = f.read()
+                expected = ''.join(f"{boxes[i][0]} {boxes[i][1]:.6f} {boxes[i][2]:.6f} {boxes[i][3]:.6f} {boxes[i][4]:.6f}\n"
+                                   for i in reference_keep(boxes))
+                self.assertEqual(got, expected, f"trial {trial}")
+
+if __name__ == '__main__':
+    unittest.main()
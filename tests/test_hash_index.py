@@ -0,0 +1,68 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from hash_index import hamming, near_duplicate_groups
+
+def brute_force_groups(items, max_distance):
+    """Reference: compare every pair, union-find over the matches."""
+    parent = list(range(len(items)))
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+    for i in range(len(items)):
+        for j in range(i + 1, len(items)):
+            if items[i][1] is None or items[j][1] is None:
+                continue
+            if hamming(items[i][1], items[j][1]) <= max_distance:
+                ri, rj = find(i), find(j)
+                if ri != rj:
+                    parent[max(ri, rj)] = min(ri, rj)
+    groups = {}
+    for i in range(len(items)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(sorted(items[i][0] for i in g) for g in groups.values() if len(g) > 1)
+
+def random_items(rng, count, clusters, max_flips):
+    """Random 64-bit hashes plus near copies (a few flipped bits) of some of them, and a few None."""
+    hashes = [rng.getrandbits(64) for _ in range(count)]
+    for _ in range(clusters):
+        base = rng.choice(hashes)
+        for _ in range(rng.randint(1, 4)):
+            flipped = base
+            for bit in rng.sample(range(64), rng.randint(0, max_flips)):
+                flipped ^= 1 << bit
+            hashes.append(flipped)
+    items = [(f"img_{i}", h) for i, h in enumerate(hashes)]
+    items += [(f"unreadable_{i}", None) for i in range(3)]
+    rng.shuffle(items)
+    return items
+
+class NearDuplicateGroupsTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        for max_distance in (0, 3, 6, 10):
+            items = random_items(rng, 400, 60, max_distance + 3)
+            expected = brute_force_groups(items, max_distance)
+            got = sorted(sorted(g) for g in near_duplicate_groups(items, max_distance))
+            self.assertEqual(got, expected, f"max_distance={max_distance}")
+
+    def test_large_bucket_is_compared_in_blocks(self):
+        # Many copies of one frame: one bucket larger than the comparison block
+        rng = random.Random(1)
+        base = rng.getrandbits(64)
+        items = [(f"copy_{i}", base ^ (1 << rng.randrange(64))) for i in range(300)]
+        items += [(f"other_{i}", rng.getrandbits(64)) for i in range(100)]
+        expected = brute_force_groups(items, 6)
+        got = sorted(sorted(g) for g in near_duplicate_groups(items, 6, block=64))
+        self.assertEqual(got, expected)
+
+    def test_groups_keep_input_order(self):
+        items = [("b", 0b1111), ("a", 0b1110), ("c", 1 << 40)]
+        self.assertEqual(near_duplicate_groups(items, 2), [["b", "a"]])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from inference import decode_output
+
+def head_output(anchors, num_classes=9, total=400):
+    """Raw detection head output with the given (cx, cy, w, h, cls, score) anchors, the rest empty."""
+    output = np.zeros((4 + num_classes, total), dtype=np.float32)
+    for i, (cx, cy, w, h, cls, score) in enumerate(anchors):
+        output[:4, i] = cx, cy, w, h
+        output[4 + cls, i] = score
+    return output
+
+class DecodeOutputTest(unittest.TestCase):
+    def test_duplicates_above_max_det_dont_hide_other_objects(self):
+        # 350 copies of one hardhat, more than max_det, and one person with a lower score
+        anchors = [(100, 100, 50, 50, 0, 0.9)] * 350 + [(300, 300, 80, 160, 3, 0.5)]
+        boxes = decode_output(head_output(anchors), (640, 640, 3), 1.0, (0, 0), conf=0.10)
+        self.assertEqual(boxes[:, 5].tolist(), [0, 3])
+        np.testing.assert_allclose(boxes[1, :4], [260, 220, 340, 380])
+
+    def test_max_det_limits_the_result(self):
+        anchors = [(20 + 30 * i, 100, 20, 20, 0, 0.9 - i * 0.01) for i in range(10)]
+        boxes = decode_output(head_output(anchors), (640, 640, 3), 1.0, (0, 0), conf=0.10, max_det=4)
+        self.assertEqual(len(boxes), 4)
+        self.assertTrue(np.all(np.diff(boxes[:, 4]) <= 0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from zones import merge_detections
+
+PERSON = [0, 0, 100, 200, 0.9, 3]
+PERSON_BEHIND = [10, 10, 60, 120, 0.8, 3] # mostly inside the first one
+
+class MergeDetectionsTest(unittest.TestCase):
+    def test_single_window_is_not_merged(self):
+        data = merge_detections([(np.array([PERSON, PERSON_BEHIND]), (5, 7))])
+        self.assertEqual(len(data), 2)
+        np.testing.assert_allclose(data[0, :4], [5, 7, 105, 207])
+
+    def test_boxes_of_the_same_window_are_kept(self):
+        parts = [(np.array([PERSON, PERSON_BEHIND]), (0, 0)), (np.zeros((0, 6)), (0, 0))]
+        self.assertEqual(len(merge_detections(parts)), 2)
+
+    def test_cut_off_box_of_another_window_is_suppressed(self):
+        parts = [(np.array([PERSON]), (0, 0)), (np.array([[0, 0, 50, 110, 0.8, 3]]), (10, 10))]
+        data = merge_detections(parts)
+        self.assertEqual(data[:, 4].tolist(), [0.9])
+
+    def test_other_classes_are_kept(self):
+        parts = [(np.array([PERSON]), (0, 0)), (np.array([PERSON_BEHIND[:5] + [0]]), (0, 0))]
+        self.assertEqual(len(merge_detections(parts)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,14 @@
 from ultralytics import YOLO
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from training_cache import build_cache
+
+IMGSZ = 640
+# Train on a copy of the dataset pre-letterboxed to IMGSZ (see scripts/training_cache.py)
+# instead of decoding + resizing the full-resolution images every epoch
+USE_CACHE = True
 
 def train_model():
     # 1. Load the model (YOLOv11 nano version)
@@ -14,12 +23,18 @@ def train_model():
         print("Please make sure you extracted the downloaded folder into 'SmartFactory/dataset'")
         return
 
+    if USE_CACHE:
+        # Only new / changed images are re-processed, an up-to-date cache takes seconds to check
+        yaml_path = build_cache(os.path.dirname(yaml_path), IMGSZ)
+
     print("Starting training... (This may take a while depending on your PC)")
     
     # 3. Train
     # epochs=20 is a good start for a demo
     # imgsz=640 is standard
-    results = model.train(data=yaml_path, epochs=5, imgsz=640, plots=True)
+    # cache='disk' keeps each decoded (already small) cache image as a .npy next to it
+    results = model.train(data=yaml_path, epochs=5, imgsz=IMGSZ, plots=True,
+                          cache='disk' if USE_CACHE else False)
     
     # 4. Export the best model
     # It usually saves to runs/detect/train/weights/best.pt